@@ -52,6 +52,14 @@ class Settings(BaseSettings):
     model_name: str = "claude-sonnet-4-5-79066"
     model_api_endpoint: str = "https://ai.us-east-1.cloud.singlestore.com/5cc87edb-3e18-48f8-bef9-6097eb8fcab6/v1"
     
+    # Realtime streaming
+    kafka_bootstrap_servers: str = ""  # empty disables the live telemetry feed
+    # TOPIC_PATTERN, shared with the ingest consumer so both read the same topics
+    topic_pattern: str = "^.+_telemetry$"
+    realtime_position_interval: float = 1.0  # seconds; max one position per vehicle per interval
+    realtime_hub: str = "local"  # "local" (single worker) or "unix" (multi-worker on one host)
+    realtime_hub_path: str = "/tmp/ford-fleet-realtime.sock"
+
     # Demo user credentials (for login endpoint)
     demo_users: dict = {
         "territory_manager_1": {
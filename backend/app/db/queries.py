@@ -303,6 +303,8 @@ def get_anomalies(
             a.region_id,
             a.territory_id,
             a.detected_at,
+            a.ended_at,
+            a.occurrences,
             a.anomaly_type,
             a.severity,
             a.description,
@@ -351,6 +353,8 @@ def get_anomalies(
     # Convert types
     for row in results:
         row["detected_at"] = row["detected_at"].isoformat() if hasattr(row["detected_at"], 'isoformat') else str(row["detected_at"])
+        if row.get("ended_at"):
+            row["ended_at"] = row["ended_at"].isoformat() if hasattr(row["ended_at"], 'isoformat') else str(row["ended_at"])
         if row.get("acknowledged_at"):
             row["acknowledged_at"] = row["acknowledged_at"].isoformat() if hasattr(row["acknowledged_at"], 'isoformat') else str(row["acknowledged_at"])
         for field in ["metric_value", "threshold_value"]:
@@ -437,22 +441,29 @@ def get_driver_notes(
 # Real-time Dashboard Queries
 # =============================================================================
 
-def get_realtime_stats(role: str) -> dict:
-    """Get real-time statistics for WebSocket updates."""
-    
-    # Recent telemetry (last 5 seconds)
-    recent_sql = """
-        SELECT 
-            COUNT(*) as events_5s,
-            AVG(speed) as avg_speed,
-            MAX(speed) as max_speed,
-            AVG(engine_temp) as avg_temp,
-            MAX(engine_temp) as max_temp
-        FROM telemetry_raw
-        WHERE ts > DATE_SUB(NOW(), INTERVAL 5 SECOND)
+def get_realtime_stats(role: str, include_recent: bool = True) -> dict:
+    """
+    Get real-time statistics for WebSocket updates.
+
+    With ``include_recent=False`` the 5-second telemetry aggregates are
+    skipped; callers fill them from in-memory window stats instead.
     """
     
-    recent = execute_query(recent_sql, (), role)
+    # Recent telemetry (last 5 seconds)
+    recent = None
+    if include_recent:
+        recent_sql = """
+            SELECT 
+                COUNT(*) as events_5s,
+                AVG(speed) as avg_speed,
+                MAX(speed) as max_speed,
+                AVG(engine_temp) as avg_temp,
+                MAX(engine_temp) as max_temp
+            FROM telemetry_raw
+            WHERE ts > DATE_SUB(NOW(), INTERVAL 5 SECOND)
+        """
+        
+        recent = execute_query(recent_sql, (), role)
     
     # Active vehicles (seen in last minute)
     active_sql = """
@@ -472,9 +483,9 @@ def get_realtime_stats(role: str) -> dict:
             severity,
             detected_at
         FROM anomalies
-        WHERE detected_at > DATE_SUB(NOW(), INTERVAL 1 MINUTE)
+        WHERE COALESCE(ended_at, detected_at) > DATE_SUB(NOW(), INTERVAL 1 MINUTE)
             AND acknowledged = 0
-        ORDER BY detected_at DESC
+        ORDER BY COALESCE(ended_at, detected_at) DESC
         LIMIT 10
     """
     
@@ -483,13 +494,47 @@ def get_realtime_stats(role: str) -> dict:
     for a in anomalies:
         a["detected_at"] = a["detected_at"].isoformat() if hasattr(a["detected_at"], 'isoformat') else str(a["detected_at"])
     
-    return {
-        "events_per_5s": recent[0]["events_5s"] if recent else 0,
-        "avg_speed": float(recent[0]["avg_speed"] or 0) if recent else 0,
-        "max_speed": float(recent[0]["max_speed"] or 0) if recent else 0,
-        "avg_temp": float(recent[0]["avg_temp"] or 0) if recent else 0,
-        "max_temp": float(recent[0]["max_temp"] or 0) if recent else 0,
+    stats = {
         "active_vehicles": active[0]["active_count"] if active else 0,
         "recent_anomalies": anomalies
     }
+    if include_recent:
+        stats.update({
+            "events_per_5s": recent[0]["events_5s"] if recent else 0,
+            "avg_speed": float(recent[0]["avg_speed"] or 0) if recent else 0,
+            "max_speed": float(recent[0]["max_speed"] or 0) if recent else 0,
+            "avg_temp": float(recent[0]["avg_temp"] or 0) if recent else 0,
+            "max_temp": float(recent[0]["max_temp"] or 0) if recent else 0,
+        })
+    return stats
+
 
+def get_change_fingerprint() -> dict:
+    """
+    Get cheap change markers for dashboard invalidation.
+
+    Uses the main credentials: the markers only say *whether* data changed,
+    and each client re-fetches through its own RLS-scoped endpoints.
+    """
+    
+    vehicle_sql = """
+        SELECT MAX(last_seen_ts) as last_seen, COUNT(*) as vehicle_count
+        FROM vehicle_state
+    """
+    
+    anomaly_sql = """
+        SELECT 
+            COUNT(*) as anomaly_count,
+            MAX(detected_at) as last_detected,
+            MAX(ended_at) as last_ended,
+            SUM(acknowledged) as acknowledged_count
+        FROM anomalies
+    """
+    
+    vehicles = execute_query(vehicle_sql)
+    anomalies = execute_query(anomaly_sql)
+    
+    return {
+        "vehicles": tuple(str(v) for v in vehicles[0].values()) if vehicles else (),
+        "anomalies": tuple(str(v) for v in anomalies[0].values()) if anomalies else (),
+    }
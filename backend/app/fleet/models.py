@@ -111,6 +111,8 @@ class Anomaly(BaseModel):
     region_id: str
     territory_id: str
     detected_at: str
+    ended_at: Optional[str] = None
+    occurrences: int = 1
     anomaly_type: str
     severity: str
     description: Optional[str] = None
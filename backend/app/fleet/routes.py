@@ -24,6 +24,7 @@ from app.fleet.models import (
     DriverNote,
     DriverNotesResponse,
 )
+from app.realtime.websocket import invalidate
 
 router = APIRouter(prefix="/fleet", tags=["Fleet Management"])
 
@@ -200,6 +201,9 @@ async def acknowledge_anomaly(
             detail=f"Anomaly {anomaly_id} not found"
         )
     
+    # Tell open dashboards to re-fetch anomalies right away
+    await invalidate(["anomalies", "summary"])
+    
     return AcknowledgeResponse(
         success=True,
         anomaly_id=anomaly_id,
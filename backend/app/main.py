@@ -11,6 +11,8 @@ from app.config import get_settings
 from app.auth.routes import router as auth_router
 from app.fleet.routes import router as fleet_router
 from app.realtime.websocket import router as realtime_router
+from app.realtime.websocket import start_realtime, stop_realtime
+from app.realtime.sse import router as sse_router
 from app.ai.routes import router as ai_router
 
 settings = get_settings()
@@ -63,9 +65,22 @@ app.add_middleware(
 app.include_router(auth_router)
 app.include_router(fleet_router)
 app.include_router(realtime_router)
+app.include_router(sse_router)
 app.include_router(ai_router)
 
 
+@app.on_event("startup")
+async def startup():
+    """Start background realtime tasks."""
+    await start_realtime()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Stop background realtime tasks."""
+    await stop_realtime()
+
+
 @app.get("/", tags=["Health"])
 async def root():
     """API root - health check."""
@@ -0,0 +1,56 @@
+"""
+Wire encoding for realtime WebSocket frames.
+
+Clients receive JSON text frames by default. A client can opt into binary
+MessagePack frames with the ``msgpack`` subprotocol or ``?format=msgpack``.
+"""
+
+import json
+from typing import Optional, Union
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; JSON is always available
+    msgpack = None
+
+FORMAT_JSON = "json"
+FORMAT_MSGPACK = "msgpack"
+
+SUBPROTOCOL_MSGPACK = "msgpack"
+
+
+def msgpack_available() -> bool:
+    """Whether binary MessagePack frames can be produced."""
+    return msgpack is not None
+
+
+def negotiate_format(
+    requested: Optional[str],
+    subprotocols: list[str]
+) -> tuple[str, Optional[str]]:
+    """
+    Pick the frame format for a new connection.
+
+    Returns the format and the subprotocol to echo back on accept
+    (None when the client did not offer one we honour).
+    """
+    if msgpack_available():
+        if SUBPROTOCOL_MSGPACK in subprotocols:
+            return FORMAT_MSGPACK, SUBPROTOCOL_MSGPACK
+        if requested == FORMAT_MSGPACK:
+            return FORMAT_MSGPACK, None
+    return FORMAT_JSON, None
+
+
+def _default(value):
+    """Fallback serializer for values json/msgpack can't handle natively."""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_message(message: dict, fmt: str) -> Union[str, bytes]:
+    """Encode a message once so it can be sent to many sockets."""
+    if fmt == FORMAT_MSGPACK:
+        return msgpack.packb(message, default=_default, use_bin_type=True)
+    return json.dumps(message, separators=(",", ":"), default=_default)
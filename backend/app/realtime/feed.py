@@ -0,0 +1,170 @@
+"""
+In-memory telemetry feed for realtime channels.
+
+Tails the customer telemetry topics (the same events the ingest consumer
+writes to vehicle_state) and keeps the latest position per vehicle.
+Vehicles updated since the last drain are tracked in a dirty set, so any
+number of events per vehicle collapse into one position per interval.
+Every event is also folded into sliding-window stats (app.realtime.window).
+
+Records are decoded here rather than by the Kafka client, so a payload
+that is not a JSON object is counted in ``skipped`` and passed over. If
+the brokers cannot be reached, or the consumer fails, the thread closes
+it and reconnects with backoff; ``alive`` is false until it is
+subscribed again, and callers fall back to database stats meanwhile.
+
+Event times are parsed once per event into integer epoch microseconds,
+whichever format the producer sends (naive ISO strings are UTC, as in the
+ingest consumer); positions and window buckets both use that value, and
+positions get their ISO ``ts`` only when drained for sending.
+"""
+
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from app.realtime.window import SlidingWindowStats
+
+POSITION_FIELDS = (
+    "vehicle_id", "region_id", "territory_id",
+    "lat", "lon", "speed", "heading", "ts",
+)
+
+# Reconnect backoff after a Kafka error, doubling up to the maximum
+RECONNECT_MIN_SECONDS = 1.0
+RECONNECT_MAX_SECONDS = 30.0
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def epoch_micros(ts: Any) -> Optional[int]:
+    """Integer epoch microseconds for an epoch-microsecond or ISO ``ts`` (naive ISO is UTC)."""
+    if isinstance(ts, int) and not isinstance(ts, bool):
+        return ts
+    if not isinstance(ts, str):
+        return None
+    try:
+        moment = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    delta = moment - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def iso_timestamp(ts: Any) -> Any:
+    """ISO string for an epoch-microsecond ``ts`` (other values pass through)."""
+    if isinstance(ts, int):
+        moment = datetime(1970, 1, 1) + timedelta(microseconds=ts)
+        return moment.isoformat(timespec="microseconds") + "Z"
+    return ts
+
+
+class TelemetryFeed:
+    """Background Kafka tail holding per-vehicle latest state."""
+
+    def __init__(self, bootstrap_servers: str, topic_pattern: str):
+        self.bootstrap_servers = bootstrap_servers
+        self.topic_pattern = topic_pattern
+        self.latest: dict[str, dict[str, Any]] = {}
+        self.stats = SlidingWindowStats()
+        self._dirty: set[str] = set()
+        self.skipped = 0
+        self._connected = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="telemetry-feed", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    @property
+    def alive(self) -> bool:
+        """Whether the feed is subscribed and tailing (its stats are current)."""
+        return self._connected and self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        delay = RECONNECT_MIN_SECONDS
+        while not self._stop.is_set():
+            try:
+                self._consume()
+                return
+            except Exception as e:
+                if self._connected:
+                    delay = RECONNECT_MIN_SECONDS
+                print(f"Realtime feed failed, reconnecting in {delay:.0f}s: {e}")
+            finally:
+                self._connected = False
+            if self._stop.wait(delay):
+                return
+            delay = min(delay * 2, RECONNECT_MAX_SECONDS)
+
+    def _consume(self):
+        from kafka import KafkaConsumer
+
+        # No group: every feed sees every partition and never commits
+        consumer = KafkaConsumer(
+            bootstrap_servers=self.bootstrap_servers,
+            group_id=None,
+            auto_offset_reset="latest",
+            enable_auto_commit=False,
+        )
+        try:
+            consumer.subscribe(pattern=self.topic_pattern)
+            print(f"Realtime feed subscribed to {self.topic_pattern} at {self.bootstrap_servers}")
+            self._connected = True
+            while not self._stop.is_set():
+                messages = consumer.poll(timeout_ms=500)
+                for records in messages.values():
+                    for record in records:
+                        self.apply_raw(record.value)
+        finally:
+            consumer.close()
+
+    def apply_raw(self, value: bytes):
+        """Decode one record and apply it, skipping anything that is not a telemetry event."""
+        try:
+            event = json.loads(value)
+            if not isinstance(event, dict):
+                raise TypeError(f"expected a JSON object, got {type(event).__name__}")
+            self.apply(event)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self.skipped += 1
+
+    def apply(self, event: dict[str, Any]):
+        """Fold one telemetry event into the window stats and latest-state map."""
+        ts = epoch_micros(event.get("ts"))
+        self.stats.add(event, ts // 1_000_000 if ts is not None else None)
+        if ts is None:
+            return
+        vid = event["vehicle_id"]
+        current = self.latest.get(vid)
+        if current is not None and ts <= current["ts"]:
+            return
+        position = {f: event.get(f) for f in POSITION_FIELDS}
+        position["ts"] = ts
+        with self._lock:
+            self.latest[vid] = position
+            self._dirty.add(vid)
+
+    def drain_dirty(self) -> list[dict[str, Any]]:
+        """Return one position per vehicle updated since the last drain, with ISO timestamps."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            positions = [self.latest[vid] for vid in dirty]
+        return [dict(position, ts=iso_timestamp(position["ts"])) for position in positions]
@@ -0,0 +1,192 @@
+"""
+Cross-worker pub/sub hub for realtime fan-out.
+
+With several uvicorn workers, exactly one worker is elected producer: it
+computes realtime stats and tails the telemetry feed, then publishes each
+event once through the hub. Every worker (the producer included) receives
+the events and fans them out to its own WebSocket clients.
+
+Backends implement the ``Hub`` interface:
+- ``LocalHub``: single process, the worker is always the producer
+- ``UnixSocketHub``: workers on one host, elected via a lock file and
+  connected over a Unix domain socket
+
+A networked backend (e.g. Redis pub/sub plus a lease key for election)
+can replace these by implementing the same four methods.
+"""
+
+import abc
+import asyncio
+import fcntl
+import json
+import os
+import struct
+from typing import Any, Awaitable, Callable, Optional
+
+from app.realtime.codec import FORMAT_JSON, encode_message
+
+MessageHandler = Callable[[dict[str, Any]], Awaitable[None]]
+LeaderHandler = Callable[[], Awaitable[None]]
+
+_FRAME_HEADER = struct.Struct("!I")
+
+
+class Hub(abc.ABC):
+    """Pub/sub backend interface."""
+
+    # True when events published here reach other processes
+    distributed = False
+
+    def __init__(self):
+        self.is_leader = False
+        self._on_message: Optional[MessageHandler] = None
+        self._on_leader: Optional[LeaderHandler] = None
+
+    @abc.abstractmethod
+    async def start(self, on_message: MessageHandler, on_leader: LeaderHandler):
+        """Join the hub; ``on_leader`` runs once this worker is elected."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def publish(self, message: dict[str, Any]):
+        """Deliver ``message`` to every worker (producer only)."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def stop(self):
+        """Leave the hub and release leadership."""
+        raise NotImplementedError
+
+
+class LocalHub(Hub):
+    """In-process hub for a single worker."""
+
+    async def start(self, on_message: MessageHandler, on_leader: LeaderHandler):
+        self._on_message = on_message
+        self.is_leader = True
+        await on_leader()
+
+    async def publish(self, message: dict[str, Any]):
+        await self._on_message(message)
+
+    async def stop(self):
+        self.is_leader = False
+
+
+class UnixSocketHub(Hub):
+    """
+    Hub for workers sharing a host.
+
+    The worker holding an exclusive lock on ``<path>.lock`` is the producer
+    and serves a Unix socket at ``path``; the others connect to it and
+    receive length-prefixed JSON frames. If the producer exits, the lock
+    is released and a follower takes over on its next reconnect attempt.
+    """
+
+    distributed = True
+
+    def __init__(self, path: str, retry_delay: float = 1.0):
+        super().__init__()
+        self.path = path
+        self.retry_delay = retry_delay
+        self._lock_fd: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._followers: set[asyncio.StreamWriter] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, on_message: MessageHandler, on_leader: LeaderHandler):
+        self._on_message = on_message
+        self._on_leader = on_leader
+        self._task = asyncio.create_task(self._run())
+
+    def _try_acquire_lock(self) -> bool:
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _run(self):
+        while True:
+            if self._try_acquire_lock():
+                await self._lead()
+                return
+            try:
+                await self._follow()
+            except (ConnectionError, FileNotFoundError, asyncio.IncompleteReadError):
+                pass
+            await asyncio.sleep(self.retry_delay)
+
+    async def _lead(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._accept_follower, path=self.path)
+        self.is_leader = True
+        print(f"Realtime hub: elected producer (pid {os.getpid()})")
+        await self._on_leader()
+
+    async def _accept_follower(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._followers.add(writer)
+        try:
+            # Followers never send; wait for them to hang up
+            await reader.read()
+        finally:
+            self._followers.discard(writer)
+            writer.close()
+
+    async def _follow(self):
+        reader, writer = await asyncio.open_unix_connection(self.path)
+        try:
+            while True:
+                header = await reader.readexactly(_FRAME_HEADER.size)
+                (length,) = _FRAME_HEADER.unpack(header)
+                payload = await reader.readexactly(length)
+                await self._on_message(json.loads(payload))
+        finally:
+            writer.close()
+
+    async def publish(self, message: dict[str, Any]):
+        payload = encode_message(message, FORMAT_JSON).encode("utf-8")
+        frame = _FRAME_HEADER.pack(len(payload)) + payload
+        followers = list(self._followers)
+        for writer in followers:
+            writer.write(frame)
+        results = await asyncio.gather(
+            *(w.drain() for w in followers), return_exceptions=True
+        )
+        for writer, result in zip(followers, results):
+            if isinstance(result, Exception):
+                self._followers.discard(writer)
+                writer.close()
+        await self._on_message(message)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._followers):
+                writer.close()
+            self._followers.clear()
+        if self._lock_fd is not None:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        self.is_leader = False
+
+
+def create_hub(backend: str, path: str) -> Hub:
+    """Build the hub backend selected by ``realtime_hub``."""
+    if backend == "unix":
+        return UnixSocketHub(path)
+    if backend == "local":
+        return LocalHub()
+    raise ValueError(f"Unknown realtime hub backend: {backend}")
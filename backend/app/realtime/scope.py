@@ -0,0 +1,32 @@
+"""
+Visibility scopes for realtime data.
+
+A scope mirrors the RLS boundary of a user: everything, one region, or
+one territory.
+"""
+
+from typing import Any, Optional
+
+# ("all", None), ("region", "WEST") or ("territory", "WEST_1")
+Scope = tuple[str, Optional[str]]
+
+SCOPE_ALL: Scope = ("all", None)
+
+
+def scope_for(role: str, region_id: Optional[str], territory_id: Optional[str]) -> Scope:
+    """Derive the data scope a user may see from their role assignment."""
+    if role == "territory_manager" and territory_id:
+        return ("territory", territory_id)
+    if role == "regional_manager" and region_id:
+        return ("region", region_id)
+    return SCOPE_ALL
+
+
+def in_scope(scope: Scope, item: dict[str, Any]) -> bool:
+    """Whether a record with region_id/territory_id is visible in ``scope``."""
+    kind, value = scope
+    if kind == "territory":
+        return item.get("territory_id") == value
+    if kind == "region":
+        return item.get("region_id") == value
+    return True
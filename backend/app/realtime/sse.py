@@ -0,0 +1,93 @@
+"""
+Server-sent events endpoint for dashboard invalidations.
+
+Instead of polling /fleet/summary, /fleet/vehicles and /fleet/anomalies,
+the dashboard keeps one EventSource open and re-fetches a resource only
+when an ``invalidate`` event names it.
+"""
+
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+
+from app.auth.jwt import decode_token
+
+router = APIRouter(tags=["Realtime"])
+
+KEEPALIVE_SECONDS = 15
+CLIENT_QUEUE_SIZE = 16
+
+
+class SSEBroker:
+    """Tracks open event streams and fans frames out to them."""
+
+    def __init__(self):
+        self.clients: set[asyncio.Queue] = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.clients.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.clients.discard(queue)
+
+    def publish(self, event: str, data: dict):
+        """Encode an event once and queue it for every open stream."""
+        frame = f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+        for queue in self.clients:
+            try:
+                queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                # Invalidations are idempotent; a slow client picks up the next one
+                pass
+
+
+broker = SSEBroker()
+
+
+@router.get("/realtime/events")
+async def events_endpoint(token: Optional[str] = Query(None)):
+    """
+    Server-sent events stream of dashboard invalidations.
+
+    Connect with: new EventSource('/realtime/events?token=<jwt_token>')
+
+    Emits ``invalidate`` events whose data is
+    ``{"resources": ["summary" | "vehicles" | "anomalies", ...]}`` when the
+    underlying data changes.
+    """
+
+    # EventSource cannot set headers, so the token comes as a query param
+    if not token or not decode_token(token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or missing token"
+        )
+
+    queue = broker.subscribe()
+
+    async def stream():
+        try:
+            yield f"retry: {KEEPALIVE_SECONDS * 1000}\n\n"
+            while True:
+                try:
+                    frame = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield frame
+        finally:
+            broker.unsubscribe(queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
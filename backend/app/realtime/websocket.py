@@ -1,54 +1,153 @@
 """
 WebSocket endpoint for real-time dashboard updates.
 Queries the database periodically and pushes updates to connected clients.
+
+One worker (the elected producer, see app.realtime.hub) computes updates
+and publishes them through the hub; every worker fans them out to its own
+sockets.
 """
 
 import asyncio
-import json
-from typing import Optional
+import time
+from dataclasses import dataclass, field
+from typing import Any, Optional, Union
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
 
 from app.auth.jwt import decode_token
+from app.config import get_settings
 from app.db import queries
+from app.realtime.codec import FORMAT_MSGPACK, encode_message, negotiate_format
+from app.realtime.feed import TelemetryFeed
+from app.realtime.hub import create_hub
+from app.realtime.scope import Scope, in_scope, scope_for
+from app.realtime.sse import broker as sse_broker
 
 router = APIRouter(tags=["Realtime"])
 
+settings = get_settings()
+
+UPDATE_INTERVAL_SECONDS = 2
+
+CHANNEL_STATS = "stats"
+CHANNEL_POSITIONS = "positions"
+CHANNELS = (CHANNEL_STATS, CHANNEL_POSITIONS)
+
+# Hub-only channel carrying dashboard invalidations to SSE streams
+CHANNEL_INVALIDATE = "invalidate"
+
+# Minimum seconds between invalidations of a resource; live positions and
+# stats already cover the fast-moving parts of the dashboard
+INVALIDATE_MIN_INTERVAL = {
+    "anomalies": 0.0,
+    "vehicles": 5.0,
+    "summary": 10.0,
+}
+
+@dataclass(eq=False)
+class Client:
+    """A connected WebSocket, its scope and the frame format it negotiated."""
+    websocket: WebSocket
+    role: str
+    scope: Scope
+    fmt: str
+    channels: frozenset[str] = field(default=frozenset({CHANNEL_STATS}))
+
 
 class ConnectionManager:
     """Manages WebSocket connections."""
-    
+
     def __init__(self):
-        self.active_connections: list[tuple[WebSocket, str]] = []
-    
-    async def connect(self, websocket: WebSocket, role: str):
-        await websocket.accept()
-        self.active_connections.append((websocket, role))
-    
+        self.active_connections: list[Client] = []
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        role: str,
+        scope: Scope,
+        fmt: str,
+        channels: frozenset[str],
+        subprotocol: Optional[str] = None
+    ) -> Client:
+        await websocket.accept(subprotocol=subprotocol)
+        client = Client(
+            websocket=websocket, role=role, scope=scope,
+            fmt=fmt, channels=channels
+        )
+        self.active_connections.append(client)
+        return client
+
     def disconnect(self, websocket: WebSocket):
         self.active_connections = [
-            (ws, role) for ws, role in self.active_connections 
-            if ws != websocket
+            c for c in self.active_connections
+            if c.websocket != websocket
         ]
-    
-    async def send_personal_message(self, message: dict, websocket: WebSocket):
-        await websocket.send_json(message)
-    
-    async def broadcast(self, message: dict):
-        for websocket, role in self.active_connections:
+
+    def roles(self, channel: str = CHANNEL_STATS) -> set[str]:
+        """Roles with at least one connection subscribed to ``channel``."""
+        return {c.role for c in self.active_connections if channel in c.channels}
+
+    def scopes(self, channel: str) -> set[Scope]:
+        """Scopes with at least one connection subscribed to ``channel``."""
+        return {c.scope for c in self.active_connections if channel in c.channels}
+
+    async def send_frame(self, client: Client, frame: Union[str, bytes]):
+        if client.fmt == FORMAT_MSGPACK:
+            await client.websocket.send_bytes(frame)
+        else:
+            await client.websocket.send_text(frame)
+
+    async def send_personal_message(self, message: dict, client: Client):
+        await self.send_frame(client, encode_message(message, client.fmt))
+
+    async def broadcast(
+        self,
+        message: dict,
+        channel: str = CHANNEL_STATS,
+        role: Optional[str] = None,
+        scope: Optional[Scope] = None
+    ):
+        """
+        Send a message to every client on ``channel`` matching role/scope.
+
+        The payload is encoded once per frame format and the same bytes
+        are written to each matching socket.
+        """
+        frames: dict[str, Union[str, bytes]] = {}
+        for client in list(self.active_connections):
+            if channel not in client.channels:
+                continue
+            if role is not None and client.role != role:
+                continue
+            if scope is not None and client.scope != scope:
+                continue
+            frame = frames.get(client.fmt)
+            if frame is None:
+                frame = frames[client.fmt] = encode_message(message, client.fmt)
             try:
-                await websocket.send_json(message)
-            except:
-                pass
+                await self.send_frame(client, frame)
+            except Exception:
+                self.disconnect(client.websocket)
 
 
 manager = ConnectionManager()
 
+hub = create_hub(settings.realtime_hub, settings.realtime_hub_path)
+
+feed: Optional[TelemetryFeed] = None
+if settings.kafka_bootstrap_servers:
+    feed = TelemetryFeed(settings.kafka_bootstrap_servers, settings.topic_pattern)
+
+# Latest position per vehicle as seen on the hub, for new-client snapshots
+positions_cache: dict[str, dict[str, Any]] = {}
+
+_tasks: list[asyncio.Task] = []
 
-async def get_updates(role: str) -> dict:
+
+async def get_updates(role: str, include_recent: bool = True) -> dict:
     """Fetch real-time stats from database."""
     try:
-        stats = queries.get_realtime_stats(role)
+        stats = await asyncio.to_thread(queries.get_realtime_stats, role, include_recent)
         return {
             "type": "stats_update",
             "data": stats
@@ -60,74 +159,262 @@ async def get_updates(role: str) -> dict:
         }
 
 
+def feed_alive() -> bool:
+    """Whether the telemetry feed is running, so its window stats are current."""
+    return feed is not None and feed.alive
+
+
+def with_window_stats(update: dict, scope: Scope) -> dict:
+    """Fill the recent-telemetry fields of a stats update from the feed's window stats."""
+    if update["type"] != "stats_update" or not feed_alive():
+        return update
+    recent = feed.stats.query(scope, 5)
+    data = dict(update["data"])
+    data.update({
+        "events_per_5s": recent["events"],
+        "avg_speed": recent["avg_speed"],
+        "max_speed": recent["max_speed"],
+        "avg_temp": recent["avg_temp"],
+        "max_temp": recent["max_temp"],
+        "events_per_1m": feed.stats.query(scope, 60)["events"],
+        "events_per_5m": feed.stats.query(scope, 300)["events"],
+    })
+    return {"type": "stats_update", "data": data}
+
+
+def positions_message(positions: list[dict[str, Any]], scope: Scope) -> dict:
+    """Build a positions frame restricted to ``scope``."""
+    return {
+        "type": "positions",
+        "data": [p for p in positions if in_scope(scope, p)]
+    }
+
+
+async def dispatch(event: dict[str, Any]):
+    """Fan a hub event out to this worker's sockets."""
+    channel = event["channel"]
+    if channel == CHANNEL_STATS:
+        scope = tuple(event["scope"]) if event.get("scope") else None
+        await manager.broadcast(event["message"], role=event["role"], scope=scope)
+    elif channel == CHANNEL_POSITIONS:
+        positions = event["positions"]
+        for p in positions:
+            positions_cache[p["vehicle_id"]] = p
+        for scope in manager.scopes(CHANNEL_POSITIONS):
+            message = positions_message(positions, scope)
+            if message["data"]:
+                await manager.broadcast(message, channel=CHANNEL_POSITIONS, scope=scope)
+    elif channel == CHANNEL_INVALIDATE:
+        sse_broker.publish("invalidate", {"resources": event["resources"]})
+
+
+async def invalidate(resources: list[str]):
+    """
+    Tell dashboards to re-fetch ``resources`` (e.g. after a write).
+
+    Only the producer can reach other workers; elsewhere this notifies
+    local streams and the producer's change detector catches up the rest.
+    """
+    event = {"channel": CHANNEL_INVALIDATE, "resources": resources}
+    if hub.is_leader:
+        await hub.publish(event)
+    else:
+        await dispatch(event)
+
+
+def stats_targets() -> set[tuple[str, Scope]]:
+    """
+    (role, scope) pairs to compute stats for: local subscribers, or every
+    demo user's assignment when other workers may need them.
+    """
+    if hub.distributed:
+        return {
+            (u["role"], scope_for(u["role"], u["region_id"], u["territory_id"]))
+            for u in settings.demo_users.values()
+        }
+    return {(c.role, c.scope) for c in manager.active_connections if CHANNEL_STATS in c.channels}
+
+
+async def produce_stats():
+    """
+    Publish stats on a fixed interval (elected producer only).
+
+    Database stats are fetched once per role per tick rather than once per
+    socket. With the telemetry feed running, the recent-telemetry fields
+    come from in-memory window stats per scope instead of telemetry_raw;
+    while it is down (reconnecting), they come from telemetry_raw again.
+    """
+    while True:
+        await asyncio.sleep(UPDATE_INTERVAL_SECONDS)
+        targets = stats_targets()
+        use_window = feed_alive()
+        for role in {r for r, _ in targets}:
+            update = await get_updates(role, include_recent=not use_window)
+            if not use_window:
+                await hub.publish({"channel": CHANNEL_STATS, "role": role, "scope": None, "message": update})
+                continue
+            for target_role, scope in targets:
+                if target_role == role:
+                    await hub.publish({
+                        "channel": CHANNEL_STATS,
+                        "role": role,
+                        "scope": scope,
+                        "message": with_window_stats(update, scope),
+                    })
+
+
+async def produce_positions():
+    """
+    Publish coalesced vehicle positions every ``realtime_position_interval``
+    (elected producer only).
+
+    Each vehicle appears at most once per interval regardless of how many
+    events arrived for it in between.
+    """
+    while True:
+        await asyncio.sleep(settings.realtime_position_interval)
+        positions = feed.drain_dirty()
+        if positions:
+            await hub.publish({"channel": CHANNEL_POSITIONS, "positions": positions})
+
+
+async def produce_invalidations():
+    """
+    Publish dashboard invalidations when the underlying tables change
+    (elected producer only).
+
+    One fingerprint query per tick serves every open stream, and each
+    resource is invalidated at most once per INVALIDATE_MIN_INTERVAL.
+    """
+    previous: Optional[dict] = None
+    pending: set[str] = set()
+    last_sent = {resource: 0.0 for resource in INVALIDATE_MIN_INTERVAL}
+    while True:
+        await asyncio.sleep(UPDATE_INTERVAL_SECONDS)
+        if not sse_broker.clients and not hub.distributed:
+            continue
+        try:
+            fingerprint = await asyncio.to_thread(queries.get_change_fingerprint)
+        except Exception as e:
+            print(f"Invalidation check failed: {e}")
+            continue
+        if previous is not None:
+            if fingerprint["vehicles"] != previous["vehicles"]:
+                pending.update(("vehicles", "summary"))
+            if fingerprint["anomalies"] != previous["anomalies"]:
+                pending.update(("anomalies", "summary"))
+        previous = fingerprint
+
+        now = time.monotonic()
+        due = sorted(
+            r for r in pending
+            if now - last_sent[r] >= INVALIDATE_MIN_INTERVAL[r]
+        )
+        if due:
+            pending.difference_update(due)
+            for resource in due:
+                last_sent[resource] = now
+            await hub.publish({"channel": CHANNEL_INVALIDATE, "resources": due})
+
+
+async def start_producers():
+    """Start the producer loops once this worker wins the election."""
+    _tasks.append(asyncio.create_task(produce_stats()))
+    _tasks.append(asyncio.create_task(produce_invalidations()))
+    if feed is not None:
+        feed.start()
+        _tasks.append(asyncio.create_task(produce_positions()))
+
+
+async def start_realtime():
+    """Join the realtime hub (called on application startup)."""
+    await hub.start(on_message=dispatch, on_leader=start_producers)
+
+
+async def stop_realtime():
+    """Stop producer loops and leave the hub (called on application shutdown)."""
+    for task in _tasks:
+        task.cancel()
+    for task in _tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    _tasks.clear()
+    if feed is not None:
+        await asyncio.to_thread(feed.stop)
+    await hub.stop()
+
+
+def parse_channels(channels: Optional[str]) -> frozenset[str]:
+    """Parse the ``channels`` query param, defaulting to stats only."""
+    if not channels:
+        return frozenset({CHANNEL_STATS})
+    requested = {c.strip() for c in channels.split(",")}
+    return frozenset(c for c in CHANNELS if c in requested) or frozenset({CHANNEL_STATS})
+
+
 @router.websocket("/realtime/stream")
 async def websocket_endpoint(
     websocket: WebSocket,
-    token: Optional[str] = Query(None)
+    token: Optional[str] = Query(None),
+    format: Optional[str] = Query(None),
+    channels: Optional[str] = Query(None)
 ):
     """
     WebSocket endpoint for real-time dashboard updates.
-    
+
     Connect with: ws://host/realtime/stream?token=<jwt_token>
-    
-    Sends updates every 2 seconds with:
-    - Active vehicle count
-    - Recent telemetry stats
-    - New anomalies
+
+    Frames are JSON text by default. Offer the ``msgpack`` subprotocol
+    or pass ``format=msgpack`` to receive binary MessagePack frames.
+
+    ``channels`` is a comma-separated subscription list (default ``stats``):
+    - ``stats``: every 2 seconds, active vehicle count, recent telemetry
+      stats and new anomalies
+    - ``positions``: live vehicle positions in the user's scope, at most
+      one per vehicle per ``realtime_position_interval``
     """
-    
+
     # Authenticate via token query param
     if not token:
         await websocket.close(code=4001, reason="Token required")
         return
-    
+
     token_data = decode_token(token)
     if not token_data:
         await websocket.close(code=4002, reason="Invalid token")
         return
-    
+
     role = token_data.role
-    
-    await manager.connect(websocket, role)
-    
+    scope = scope_for(token_data.role, token_data.region_id, token_data.territory_id)
+    subscribed = parse_channels(channels)
+    fmt, subprotocol = negotiate_format(
+        format, websocket.scope.get("subprotocols", [])
+    )
+
+    client = await manager.connect(websocket, role, scope, fmt, subscribed, subprotocol)
+
     try:
-        # Send initial update
-        initial_data = await get_updates(role)
-        await manager.send_personal_message(initial_data, websocket)
-        
-        # Create background task for periodic updates
-        async def send_periodic_updates():
-            while True:
-                await asyncio.sleep(2)
-                try:
-                    update = await get_updates(role)
-                    await manager.send_personal_message(update, websocket)
-                except WebSocketDisconnect:
-                    break
-                except Exception as e:
-                    error_msg = {"type": "error", "message": str(e)}
-                    try:
-                        await manager.send_personal_message(error_msg, websocket)
-                    except:
-                        break
-        
-        # Start periodic updates
-        update_task = asyncio.create_task(send_periodic_updates())
-        
+        # Send initial state; periodic updates come from the shared loops
+        if CHANNEL_STATS in subscribed:
+            use_window = feed_alive() and hub.is_leader
+            initial_data = await get_updates(role, include_recent=not use_window)
+            if use_window:
+                initial_data = with_window_stats(initial_data, scope)
+            await manager.send_personal_message(initial_data, client)
+        if CHANNEL_POSITIONS in subscribed:
+            snapshot = positions_message(list(positions_cache.values()), scope)
+            await manager.send_personal_message(snapshot, client)
+
         # Wait for client messages (mainly for keepalive)
         while True:
-            try:
-                data = await websocket.receive_text()
-                # Handle client messages if needed
-                if data == "ping":
-                    await websocket.send_text("pong")
-            except WebSocketDisconnect:
-                break
-        
-        update_task.cancel()
-        
+            data = await websocket.receive_text()
+            # Handle client messages if needed
+            if data == "ping":
+                await websocket.send_text("pong")
+
     except WebSocketDisconnect:
         pass
     finally:
         manager.disconnect(websocket)
-
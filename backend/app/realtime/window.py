@@ -0,0 +1,137 @@
+"""
+In-memory sliding-window telemetry statistics.
+
+Keeps a per-second ring buffer of counts, sums and maxes for each
+territory, fed by the realtime telemetry feed. A window of W seconds over
+a scope is answered by folding W slots per territory in the scope, without
+touching telemetry_raw.
+"""
+
+import threading
+import time
+from typing import Any, Optional
+
+from app.realtime.scope import Scope
+
+DEFAULT_HORIZON_SECONDS = 300
+
+
+class _Ring:
+    """Per-second aggregates for one territory."""
+
+    __slots__ = (
+        "second", "count",
+        "speed_sum", "speed_n", "speed_max",
+        "temp_sum", "temp_n", "temp_max",
+    )
+
+    def __init__(self, size: int):
+        self.second = [-1] * size
+        self.count = [0] * size
+        self.speed_sum = [0.0] * size
+        self.speed_n = [0] * size
+        self.speed_max = [float("-inf")] * size
+        self.temp_sum = [0.0] * size
+        self.temp_n = [0] * size
+        self.temp_max = [float("-inf")] * size
+
+    def slot(self, second: int, size: int) -> int:
+        """Slot index for ``second``, clearing it if it holds an older second."""
+        i = second % size
+        if self.second[i] != second:
+            self.second[i] = second
+            self.count[i] = 0
+            self.speed_sum[i] = 0.0
+            self.speed_n[i] = 0
+            self.speed_max[i] = float("-inf")
+            self.temp_sum[i] = 0.0
+            self.temp_n[i] = 0
+            self.temp_max[i] = float("-inf")
+        return i
+
+
+class SlidingWindowStats:
+    """Realtime stats over the last ``horizon_seconds``, partitioned by territory."""
+
+    def __init__(self, horizon_seconds: int = DEFAULT_HORIZON_SECONDS):
+        self.horizon = horizon_seconds
+        self._rings: dict[str, _Ring] = {}
+        self._region_of: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def add(self, event: dict[str, Any], second: Optional[int], now: Optional[float] = None):
+        """
+        Fold one telemetry event into its territory's slot for ``second``,
+        the event time in epoch seconds (parsed by the caller).
+        """
+        now_s = int(now if now is not None else time.time())
+        if second is None or second > now_s:
+            # Missing or future (clock skew) timestamps count as arrivals now
+            second = now_s
+        if second <= now_s - self.horizon:
+            return
+
+        territory = event["territory_id"]
+        speed = event.get("speed")
+        temp = event.get("engine_temp")
+
+        with self._lock:
+            ring = self._rings.get(territory)
+            if ring is None:
+                ring = self._rings[territory] = _Ring(self.horizon)
+                self._region_of[territory] = event["region_id"]
+            i = ring.slot(second, self.horizon)
+            ring.count[i] += 1
+            if speed is not None:
+                ring.speed_sum[i] += speed
+                ring.speed_n[i] += 1
+                if speed > ring.speed_max[i]:
+                    ring.speed_max[i] = speed
+            if temp is not None:
+                ring.temp_sum[i] += temp
+                ring.temp_n[i] += 1
+                if temp > ring.temp_max[i]:
+                    ring.temp_max[i] = temp
+
+    def _territories(self, scope: Scope) -> list[str]:
+        kind, value = scope
+        if kind == "territory":
+            return [value] if value in self._rings else []
+        if kind == "region":
+            return [t for t, r in self._region_of.items() if r == value]
+        return list(self._rings)
+
+    def query(self, scope: Scope, window_seconds: int, now: Optional[float] = None) -> dict:
+        """Aggregate the last ``window_seconds`` (<= horizon) over ``scope``."""
+        window_seconds = min(window_seconds, self.horizon)
+        now_s = int(now if now is not None else time.time())
+        first = now_s - window_seconds + 1
+
+        count = speed_n = temp_n = 0
+        speed_sum = temp_sum = 0.0
+        speed_max = temp_max = float("-inf")
+
+        with self._lock:
+            for territory in self._territories(scope):
+                ring = self._rings[territory]
+                for second in range(first, now_s + 1):
+                    i = second % self.horizon
+                    if ring.second[i] != second:
+                        continue
+                    count += ring.count[i]
+                    speed_sum += ring.speed_sum[i]
+                    speed_n += ring.speed_n[i]
+                    temp_sum += ring.temp_sum[i]
+                    temp_n += ring.temp_n[i]
+                    if ring.speed_max[i] > speed_max:
+                        speed_max = ring.speed_max[i]
+                    if ring.temp_max[i] > temp_max:
+                        temp_max = ring.temp_max[i]
+
+        return {
+            "events": count,
+            "avg_speed": speed_sum / speed_n if speed_n else 0.0,
+            "max_speed": float(speed_max) if speed_n else 0.0,
+            "avg_temp": temp_sum / temp_n if temp_n else 0.0,
+            "max_temp": float(temp_max) if temp_n else 0.0,
+        }
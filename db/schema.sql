@@ -91,7 +91,8 @@ CREATE ROWSTORE TABLE IF NOT EXISTS vehicle_state (
     SHARD KEY (vehicle_id)
 );
 
--- Anomalies table - detected anomalies with acknowledgement state
+-- Anomalies table - one row per anomaly episode, with acknowledgement state
+-- (detected_at..ended_at spans every trigger; metric_value holds the peak)
 CREATE ROWSTORE TABLE IF NOT EXISTS anomalies (
     anomaly_id VARCHAR(64) NOT NULL,
     vehicle_id VARCHAR(64) NOT NULL,
@@ -99,6 +100,8 @@ CREATE ROWSTORE TABLE IF NOT EXISTS anomalies (
     region_id VARCHAR(32) NOT NULL,
     territory_id VARCHAR(32) NOT NULL,
     detected_at DATETIME(6) NOT NULL,
+    ended_at DATETIME(6),
+    occurrences INT NOT NULL DEFAULT 1,
     anomaly_type VARCHAR(64) NOT NULL,
     severity VARCHAR(16) NOT NULL,
     description TEXT,
@@ -112,6 +115,26 @@ CREATE ROWSTORE TABLE IF NOT EXISTS anomalies (
     SHARD KEY (anomaly_id)
 );
 
+-- Anomaly rules - threshold overrides read by the consumer without a restart.
+-- customer_id / model '*' match any; the most specific row for an event wins
+-- and enabled = 0 switches the rule off in that scope. hysteresis is how far
+-- a reading must recover past the threshold before an open episode closes.
+-- Rules not listed here use the consumer's built-in defaults.
+CREATE ROWSTORE TABLE IF NOT EXISTS anomaly_rules (
+    rule_name VARCHAR(64) NOT NULL,
+    customer_id VARCHAR(64) NOT NULL DEFAULT '*',
+    model VARCHAR(64) NOT NULL DEFAULT '*',
+    field VARCHAR(32) NOT NULL,
+    direction VARCHAR(8) NOT NULL DEFAULT 'above',
+    threshold DECIMAL(10, 2) NOT NULL,
+    hysteresis DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    severity VARCHAR(16) NOT NULL,
+    enabled TINYINT NOT NULL DEFAULT 1,
+    updated_at DATETIME(6) DEFAULT NOW(6) ON UPDATE NOW(6),
+    PRIMARY KEY (rule_name, customer_id, model),
+    SHARD KEY (rule_name)
+);
+
 -- =============================================================================
 -- COLUMNSTORE TABLES (Analytics)
 -- =============================================================================
@@ -139,6 +162,29 @@ CREATE TABLE IF NOT EXISTS telemetry_raw (
     SORT KEY (ts)
 );
 
+-- Telemetry rollup - per-minute territory aggregates written by the consumer.
+-- A minute is written once its partitions' watermark passes it; events that
+-- arrive later add is_correction rows, so always SUM over a minute's rows.
+CREATE TABLE IF NOT EXISTS telemetry_rollup_1m (
+    customer_id VARCHAR(64) NOT NULL,
+    region_id VARCHAR(32) NOT NULL,
+    territory_id VARCHAR(32) NOT NULL,
+    bucket_start DATETIME NOT NULL,
+    is_correction TINYINT NOT NULL DEFAULT 0,
+    events INT NOT NULL,
+    speed_sum DOUBLE,
+    speed_count INT,
+    speed_max DECIMAL(6, 2),
+    engine_temp_sum DOUBLE,
+    engine_temp_count INT,
+    engine_temp_max DECIMAL(6, 2),
+    fuel_pct_sum DOUBLE,
+    fuel_pct_count INT,
+    access_roles VARBINARY(256) NOT NULL DEFAULT ',',
+    SHARD KEY (territory_id),
+    SORT KEY (bucket_start)
+);
+
 -- Driver notes table - free text notes for AI summarization
 CREATE TABLE IF NOT EXISTS driver_notes (
     note_id VARCHAR(64) NOT NULL,
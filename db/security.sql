@@ -121,10 +121,15 @@ GRANT UPDATE ON ford_fleet.anomalies TO fleet_admin;
 GRANT INSERT ON ford_fleet.driver_notes TO fleet_admin;
 
 -- Ingest user privileges (insert-only where needed)
-GRANT INSERT ON ford_fleet.telemetry_raw TO fleet_ingest;
-GRANT INSERT ON ford_fleet.anomalies TO fleet_ingest;
+-- SELECT on telemetry_raw: deduplication warm-up on partition assignment
+GRANT SELECT, INSERT ON ford_fleet.telemetry_raw TO fleet_ingest;
+-- UPDATE on anomalies: episodes are upserted as they grow
+GRANT INSERT, UPDATE ON ford_fleet.anomalies TO fleet_ingest;
+GRANT INSERT ON ford_fleet.telemetry_rollup_1m TO fleet_ingest;
 GRANT INSERT, UPDATE ON ford_fleet.vehicle_state TO fleet_ingest;
+-- vehicles and anomaly_rules: rule reloads (model-scoped rules need vehicle models)
 GRANT SELECT ON ford_fleet.vehicles TO fleet_ingest;
+GRANT SELECT ON ford_fleet.anomaly_rules TO fleet_ingest;
 
 -- =============================================================================
 -- ROW-LEVEL SECURITY VIEWS
@@ -153,6 +158,26 @@ SELECT
 FROM telemetry_raw
 WHERE SECURITY_LISTS_INTERSECT(CURRENT_SECURITY_ROLES(), access_roles);
 
+-- RLS View for telemetry_rollup_1m
+CREATE OR REPLACE VIEW v_telemetry_rollup_1m AS
+SELECT 
+    customer_id,
+    region_id,
+    territory_id,
+    bucket_start,
+    is_correction,
+    events,
+    speed_sum,
+    speed_count,
+    speed_max,
+    engine_temp_sum,
+    engine_temp_count,
+    engine_temp_max,
+    fuel_pct_sum,
+    fuel_pct_count
+FROM telemetry_rollup_1m
+WHERE SECURITY_LISTS_INTERSECT(CURRENT_SECURITY_ROLES(), access_roles);
+
 -- RLS View for vehicles
 CREATE OR REPLACE VIEW v_vehicles AS
 SELECT 
@@ -230,18 +255,21 @@ WHERE SECURITY_LISTS_INTERSECT(CURRENT_SECURITY_ROLES(), v.access_roles);
 -- =============================================================================
 
 GRANT SELECT ON ford_fleet.v_telemetry_raw TO fleet_territory_manager;
+GRANT SELECT ON ford_fleet.v_telemetry_rollup_1m TO fleet_territory_manager;
 GRANT SELECT ON ford_fleet.v_vehicles TO fleet_territory_manager;
 GRANT SELECT ON ford_fleet.v_anomalies TO fleet_territory_manager;
 GRANT SELECT ON ford_fleet.v_driver_notes TO fleet_territory_manager;
 GRANT SELECT ON ford_fleet.v_vehicle_state TO fleet_territory_manager;
 
 GRANT SELECT ON ford_fleet.v_telemetry_raw TO fleet_regional_manager;
+GRANT SELECT ON ford_fleet.v_telemetry_rollup_1m TO fleet_regional_manager;
 GRANT SELECT ON ford_fleet.v_vehicles TO fleet_regional_manager;
 GRANT SELECT ON ford_fleet.v_anomalies TO fleet_regional_manager;
 GRANT SELECT ON ford_fleet.v_driver_notes TO fleet_regional_manager;
 GRANT SELECT ON ford_fleet.v_vehicle_state TO fleet_regional_manager;
 
 GRANT SELECT ON ford_fleet.v_telemetry_raw TO fleet_admin;
+GRANT SELECT ON ford_fleet.v_telemetry_rollup_1m TO fleet_admin;
 GRANT SELECT ON ford_fleet.v_vehicles TO fleet_admin;
 GRANT SELECT ON ford_fleet.v_anomalies TO fleet_admin;
 GRANT SELECT ON ford_fleet.v_driver_notes TO fleet_admin;
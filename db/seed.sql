@@ -279,6 +279,19 @@ SELECT
     FLOOR(10000 + RAND() * 90000)
 FROM vehicles;
 
+-- =============================================================================
+-- ANOMALY RULES (the consumer's defaults, plus tenant and model overrides)
+-- =============================================================================
+
+INSERT INTO anomaly_rules (rule_name, customer_id, model, field, direction, threshold, hysteresis, severity, enabled) VALUES
+('high_engine_temp', '*', '*', 'engine_temp', 'above', 220, 10, 'critical', 1),
+('low_battery', '*', '*', 'battery_v', 'below', 11.5, 0.5, 'warning', 1),
+('speeding', '*', '*', 'speed', 'above', 80, 5, 'info', 1),
+('low_fuel', '*', '*', 'fuel_pct', 'below', 10, 5, 'warning', 1),
+('low_fuel', '*', 'E-Transit', 'fuel_pct', 'below', 10, 5, 'warning', 0),
+('low_fuel', '*', 'F-150 Lightning', 'fuel_pct', 'below', 10, 5, 'warning', 0),
+('speeding', 'customer_b', '*', 'speed', 'above', 75, 5, 'warning', 1);
+
 -- =============================================================================
 -- DRIVER NOTES (for AI summarization demo)
 -- =============================================================================
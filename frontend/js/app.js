@@ -18,6 +18,7 @@ const App = {
         await Dashboard.init();
         AIChat.init();
         RealtimeSocket.connect();
+        RealtimeEvents.connect();
     },
 
     /**
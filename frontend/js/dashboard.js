@@ -5,6 +5,9 @@
 const Dashboard = {
     map: null,
     vehicleMarkers: [],
+    markersById: new Map(),
+    inflight: {},
+    stale: {},
     filters: {
         granularity: 'day',
         customerId: null,
@@ -26,10 +29,41 @@ const Dashboard = {
         // Setup realtime updates
         RealtimeSocket.addListener((data) => this.handleRealtimeUpdate(data));
 
-        // Auto-refresh vehicles every 3 seconds for live map updates
-        this.refreshInterval = setInterval(() => {
-            this.loadVehicles();
-        }, 3000);
+        // Re-fetch only what the server says changed (replaces polling)
+        RealtimeEvents.addListener((resources) => this.handleInvalidation(resources));
+    },
+
+    /**
+     * Reload invalidated resources, at most one request in flight per resource
+     */
+    handleInvalidation(resources) {
+        const loaders = {
+            summary: () => this.loadSummary(),
+            vehicles: () => this.loadVehicles(),
+            anomalies: () => this.loadAnomalies()
+        };
+
+        resources.forEach(resource => {
+            const load = loaders[resource];
+            if (!load) return;
+
+            if (this.inflight[resource]) {
+                // Reload once more after the current request finishes
+                this.stale[resource] = true;
+                return;
+            }
+
+            this.inflight[resource] = true;
+            load()
+                .catch(error => console.error(`Failed to reload ${resource}:`, error))
+                .finally(() => {
+                    this.inflight[resource] = false;
+                    if (this.stale[resource]) {
+                        this.stale[resource] = false;
+                        this.handleInvalidation([resource]);
+                    }
+                });
+        });
     },
 
     /**
@@ -335,6 +369,7 @@ const Dashboard = {
         // Clear existing markers
         this.vehicleMarkers.forEach(m => m.remove());
         this.vehicleMarkers = [];
+        this.markersById.clear();
 
         // Add new markers
         vehicles.forEach(v => {
@@ -367,6 +402,7 @@ const Dashboard = {
                     .addTo(this.map);
 
                 this.vehicleMarkers.push(marker);
+                this.markersById.set(v.vehicle_id, marker);
             }
         });
 
@@ -412,10 +448,10 @@ const Dashboard = {
             <div class="anomaly-item" data-id="${a.anomaly_id}">
                 <div class="severity-indicator ${a.severity}"></div>
                 <div class="anomaly-content">
-                    <div class="anomaly-type">${this.formatAnomalyType(a.anomaly_type)}</div>
+                    <div class="anomaly-type">${this.formatAnomalyType(a.anomaly_type)}${a.occurrences > 1 ? ` &times;${a.occurrences}` : ''}</div>
                     <div class="anomaly-meta">
                         <span>${a.vehicle_id}</span>
-                        <span>${this.formatTimestamp(a.detected_at)}</span>
+                        <span>${this.formatTimestamp(a.ended_at || a.detected_at)}</span>
                     </div>
                 </div>
                 <button class="btn-ack" onclick="Dashboard.acknowledgeAnomaly('${a.anomaly_id}')">
@@ -490,21 +526,28 @@ const Dashboard = {
             if (activeEl && stats.active_vehicles !== undefined) {
                 activeEl.textContent = stats.active_vehicles.toLocaleString();
             }
+        } else if (data.type === 'positions') {
+            this.moveMapMarkers(data.data);
+        }
+    },
 
-            // Add new anomalies to the list if any
-            if (stats.recent_anomalies && stats.recent_anomalies.length > 0) {
-                this.loadAnomalies();  // Refresh the anomaly list
+    /**
+     * Move existing map markers to live positions
+     */
+    moveMapMarkers(positions) {
+        positions.forEach(p => {
+            const marker = this.markersById.get(p.vehicle_id);
+            if (marker && p.lat != null && p.lon != null) {
+                marker.setLatLng([p.lat, p.lon]);
             }
-        }
+        });
     },
 
     /**
      * Clean up
      */
     destroy() {
-        if (this.refreshInterval) {
-            clearInterval(this.refreshInterval);
-        }
+        RealtimeEvents.disconnect();
         Charts.destroy();
         if (this.map) {
             this.map.remove();
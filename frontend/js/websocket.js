@@ -30,10 +30,14 @@ const RealtimeSocket = {
         const wsHost = Auth.apiBase 
             ? Auth.apiBase.replace(/^https?:/, wsProtocol)
             : `${wsProtocol}//${window.location.host}`;
-        const wsUrl = `${wsHost}/realtime/stream?token=${Auth.token}`;
+        const wsUrl = `${wsHost}/realtime/stream?token=${Auth.token}&channels=stats,positions`;
+
+        // Prefer binary MessagePack frames when the decoder is loaded
+        const protocols = window.MessagePack ? ['msgpack'] : [];
 
         try {
-            this.socket = new WebSocket(wsUrl);
+            this.socket = new WebSocket(wsUrl, protocols);
+            this.socket.binaryType = 'arraybuffer';
 
             this.socket.onopen = () => {
                 console.log('WebSocket connected');
@@ -48,7 +52,9 @@ const RealtimeSocket = {
                     return;
                 }
                 try {
-                    const data = JSON.parse(event.data);
+                    const data = event.data instanceof ArrayBuffer
+                        ? MessagePack.decode(new Uint8Array(event.data))
+                        : JSON.parse(event.data);
                     this.notifyListeners(data);
                 } catch (e) {
                     console.error('Failed to parse WebSocket message:', e);
@@ -169,3 +175,63 @@ setInterval(() => {
     RealtimeSocket.ping();
 }, 30000);
 
+
+/**
+ * Server-sent invalidations: tells the dashboard which resources changed
+ */
+const RealtimeEvents = {
+    source: null,
+    listeners: [],
+
+    /**
+     * Open the event stream
+     */
+    connect() {
+        if (this.source || !Auth.token) {
+            return;
+        }
+
+        const base = Auth.apiBase || '';
+        this.source = new EventSource(`${base}/realtime/events?token=${Auth.token}`);
+
+        this.source.addEventListener('invalidate', (event) => {
+            try {
+                const data = JSON.parse(event.data);
+                this.listeners.forEach(callback => {
+                    try {
+                        callback(data.resources || []);
+                    } catch (e) {
+                        console.error('Listener error:', e);
+                    }
+                });
+            } catch (e) {
+                console.error('Failed to parse invalidation:', e);
+            }
+        });
+
+        // EventSource reconnects on its own; just log for visibility
+        this.source.onerror = () => {
+            console.warn('Event stream interrupted, browser will retry');
+        };
+    },
+
+    /**
+     * Close the event stream
+     */
+    disconnect() {
+        if (this.source) {
+            this.source.close();
+            this.source = null;
+        }
+    },
+
+    /**
+     * Add invalidation listener
+     */
+    addListener(callback) {
+        this.listeners.push(callback);
+        return () => {
+            this.listeners = this.listeners.filter(l => l !== callback);
+        };
+    }
+};
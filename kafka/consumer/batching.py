@@ -0,0 +1,91 @@
+"""
+Ford Fleet Management Demo - Adaptive Batch Sizing
+
+A fixed BATCH_SIZE is wrong most of the time: too small under bursts
+(many tiny commits), too large when the DB slows down (long flushes while
+lag builds). ``AdaptiveBatcher`` tunes the write stage's batch size with
+AIMD against a p95 flush-latency target: it grows the size additively
+while full batches flush comfortably under the target, and halves it as
+soon as p95 goes over. The flush interval is what remains of the
+end-to-end delay budget after a typical flush, so a record never waits
+longer than the budget just to fill a batch.
+"""
+
+import math
+import os
+import threading
+from collections import deque
+from typing import Optional
+
+ADAPTIVE_BATCHING = os.getenv("ADAPTIVE_BATCHING", "true").lower() in ("1", "true", "yes")
+BATCH_MIN_SIZE = int(os.getenv("BATCH_MIN_SIZE", "50"))
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "5000"))
+TARGET_FLUSH_P95_MS = float(os.getenv("TARGET_FLUSH_P95_MS", "250"))
+MAX_BATCH_DELAY_MS = float(os.getenv("MAX_BATCH_DELAY_MS", "2000"))
+
+# Flush latencies kept for the p95 estimate
+LATENCY_WINDOW = 20
+# Shortest flush interval, so an idle stream still forms batches
+MIN_TIMEOUT_SECONDS = 0.05
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class AdaptiveBatcher:
+    """AIMD controller for batch size and flush interval, shared by the write workers."""
+
+    def __init__(
+        self,
+        initial_size: int,
+        max_timeout: float,
+        min_size: int = BATCH_MIN_SIZE,
+        max_size: int = BATCH_MAX_SIZE,
+        target_p95: float = TARGET_FLUSH_P95_MS / 1000,
+        max_delay: float = MAX_BATCH_DELAY_MS / 1000,
+        increase: Optional[int] = None,
+        decrease: float = 0.5
+    ):
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.batch_size = min(max(initial_size, self.min_size), self.max_size)
+        self.max_timeout = max_timeout
+        self.batch_timeout = max_timeout
+        self.target_p95 = target_p95
+        self.max_delay = max_delay
+        self.increase = increase or self.min_size
+        self.decrease = decrease
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def observe(self, size: int, flush_seconds: float, oldest_age: float):
+        """
+        Record one flush and adjust the limits.
+
+        ``oldest_age`` is how long the oldest record in the batch had been
+        in the consumer when the flush finished.
+        """
+        with self._lock:
+            self._latencies.append(flush_seconds)
+            p95 = percentile(list(self._latencies), 95)
+
+            if p95 > self.target_p95:
+                self.batch_size = max(self.min_size, int(self.batch_size * self.decrease))
+                # Judge the new size on its own flushes
+                self._latencies.clear()
+            elif size >= self.batch_size and oldest_age <= self.max_delay:
+                self.batch_size = min(self.max_size, self.batch_size + self.increase)
+
+            self.batch_timeout = min(self.max_timeout, max(MIN_TIMEOUT_SECONDS, self.max_delay - p95))
+
+    def gauges(self) -> dict[str, float]:
+        with self._lock:
+            p95 = percentile(list(self._latencies), 95) if self._latencies else 0.0
+            return {
+                "batch_size": self.batch_size,
+                "batch_timeout_ms": round(self.batch_timeout * 1000, 1),
+                "flush_p95_ms": round(p95 * 1000, 1),
+            }
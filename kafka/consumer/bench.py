@@ -0,0 +1,366 @@
+"""
+Ford Fleet Management Demo - End-to-End Ingest Benchmark
+
+Measures the consumer's ingest hot path on a laptop, with no Kafka or
+SingleStore running. Records are real ``VehicleSimulator`` events,
+serialized as the producer does and served from memory in poll-sized
+chunks; writes go to a stand-in connection:
+
+- ``null`` renders every statement with its parameters, as the client
+  library does before sending it, then discards it
+- ``sqlite`` executes the statements against in-memory SQLite tables
+  (upserts become ``INSERT OR REPLACE``)
+
+Two passes run over the same records:
+
+- stages: decode, detect and write each run to completion in turn, so
+  every stage is timed on its own. "build params" is the write-stage
+  time spent outside the connection (state cache, parameter tuples,
+  statement building); "write" is the time inside it.
+- pipeline: the threaded pipeline from ``build_pipeline``, end to end.
+
+With ``--malformed N`` a final pipeline pass replaces N records with
+wrongly typed ones and checks that exactly those are dead-lettered while
+every other record is written and every offset becomes committable.
+
+    python bench.py --events 200000 --vehicles 1000
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+import telemetry_consumer as consumer
+from detection import default_rules
+from deadletter import DeadLetterSink
+from dedup import Deduplicator
+from drift import DriftDetector
+from episodes import EpisodeTracker
+from events import TELEMETRY_COLUMNS
+from offsets import OffsetTracker
+from rollup import ROLLUP_COLUMNS, RollupAggregator
+from state_cache import VehicleStateCache
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "producer"))
+from telemetry_producer import VehicleSimulator  # noqa: E402
+
+FakeRecord = namedtuple("FakeRecord", "topic partition offset value")
+FakePartition = namedtuple("FakePartition", "topic partition")
+
+
+def simulate(events: int, vehicles: int, customers: int, partitions: int,
+             poll_size: int) -> list[dict[FakePartition, list[FakeRecord]]]:
+    """Serialized simulator events, grouped into poll results like ``KafkaConsumer.poll``."""
+    simulators = [
+        VehicleSimulator(f"v_bench_{i:05d}", f"customer_{i % customers:03d}",
+                         "WEST", "WEST_1", 47.6062, -122.3321)
+        for i in range(vehicles)
+    ]
+    next_offset: dict[FakePartition, int] = {}
+    polls = []
+    messages: dict[FakePartition, list[FakeRecord]] = {}
+    in_poll = 0
+    for i in range(events):
+        sim = simulators[i % vehicles]
+        tp = FakePartition(f"{sim.customer_id}_telemetry", hash(sim.vehicle_id) % partitions)
+        offset = next_offset.get(tp, 0)
+        next_offset[tp] = offset + 1
+        value = json.dumps(sim.generate_event()).encode("utf-8")
+        messages.setdefault(tp, []).append(FakeRecord(tp.topic, tp.partition, offset, value))
+        in_poll += 1
+        if in_poll == poll_size:
+            polls.append(messages)
+            messages, in_poll = {}, 0
+    if messages:
+        polls.append(messages)
+    return polls
+
+
+def _literal(value: Any) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, str):
+        return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+    if isinstance(value, datetime):
+        return "'" + value.isoformat(" ") + "'"
+    return repr(value)
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql: str, params: Optional[list] = None, infile_stream: Optional[io.BytesIO] = None):
+        started = time.perf_counter()
+        self.conn.run(sql, [params] if params is not None else [()], infile_stream)
+        self.conn.seconds += time.perf_counter() - started
+
+    def executemany(self, sql: str, rows: list):
+        started = time.perf_counter()
+        self.conn.run(sql, rows, None)
+        self.conn.seconds += time.perf_counter() - started
+
+
+class NullConnection:
+    """Renders statements client-side and drops them; ``seconds`` is time spent inside."""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.statements = 0
+
+    def cursor(self) -> _Cursor:
+        return _Cursor(self)
+
+    def run(self, sql: str, rows: list, infile_stream: Optional[io.BytesIO]):
+        if infile_stream is not None:
+            infile_stream.read()
+        for row in rows:
+            sql % tuple(_literal(v) for v in row)
+            self.statements += 1
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteConnection(NullConnection):
+    """Executes the consumer's statements in an in-memory SQLite database."""
+
+    def __init__(self):
+        super().__init__()
+        self.db = sqlite3.connect(":memory:", check_same_thread=False)
+        self.db.execute(f"CREATE TABLE telemetry_raw ({', '.join(TELEMETRY_COLUMNS)})")
+        self.db.execute(
+            "CREATE TABLE vehicle_state (vehicle_id PRIMARY KEY, last_seen_ts, status, lat, lon,"
+            " speed, heading, fuel_pct, engine_temp, battery_v, odometer)"
+        )
+        self.db.execute(
+            "CREATE TABLE anomalies (anomaly_id PRIMARY KEY, vehicle_id, customer_id, region_id,"
+            " territory_id, detected_at, ended_at, occurrences, anomaly_type, severity, description,"
+            " metric_value, threshold_value, access_roles)"
+        )
+        self.db.execute(f"CREATE TABLE telemetry_rollup_1m ({', '.join(ROLLUP_COLUMNS)})")
+
+    def run(self, sql: str, rows: list, infile_stream: Optional[io.BytesIO]):
+        if infile_stream is not None:
+            # LOAD DATA: read the TSV back into rows
+            table = sql.split("INTO TABLE ")[1].split()[0]
+            lines = infile_stream.read().decode("utf-8").splitlines()
+            rows = [[None if v == "\\N" else v for v in line.split("\t")] for line in lines]
+            sql = f"INSERT INTO {table} ({', '.join(TELEMETRY_COLUMNS)}) VALUES (" \
+                  + ", ".join(["%s"] * len(TELEMETRY_COLUMNS)) + ")"
+
+        sql = sql.split("ON DUPLICATE KEY UPDATE")[0].replace("INSERT INTO", "INSERT OR REPLACE INTO", 1)
+        head, _, groups = sql.partition("VALUES")
+        width = groups.split(")")[0].count("%s")
+        single = head + "VALUES (" + ", ".join(["?"] * width) + ")"
+        flat = []
+        for row in rows:
+            # A multi-row INSERT carries several rows in one parameter list
+            for i in range(0, len(row), width):
+                flat.append(tuple(v.isoformat(" ") if isinstance(v, datetime) else v
+                                  for v in row[i:i + width]))
+        self.db.executemany(single, flat)
+        self.statements += 1
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    def close(self):
+        self.db.close()
+
+
+SINKS: dict[str, Callable[[], NullConnection]] = {"null": NullConnection, "sqlite": SQLiteConnection}
+
+
+def reset_state():
+    """Fresh consumer state, so each pass sees the records for the first time."""
+    consumer.stats = consumer.IngestStats()
+    consumer.offset_tracker = OffsetTracker()
+    consumer.vehicle_state_cache = VehicleStateCache()
+    consumer.drift_detector = DriftDetector()
+    consumer.episode_tracker = EpisodeTracker(default_rules)
+    if consumer.deduplicator is not None:
+        consumer.deduplicator = Deduplicator()
+    if consumer.rollups is not None:
+        consumer.rollups = RollupAggregator()
+
+
+def _chunks(polls: list[dict]) -> list:
+    return [
+        consumer.Chunk([r for records in messages.values() for r in records],
+                       consumer.poll_offsets(messages))
+        for messages in polls
+    ]
+
+
+def run_stages(polls: list[dict], batch_size: int, connect: Callable[[], NullConnection]) -> dict[str, float]:
+    """Run each stage over every chunk in turn; seconds per stage."""
+    reset_state()
+    chunks = _chunks(polls)
+    timings = {}
+
+    started = time.perf_counter()
+    for chunk in chunks:
+        consumer.decode_chunk(chunk)
+    timings["decode"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for chunk in chunks:
+        consumer.detect_chunk(chunk)
+    timings["detect"] = time.perf_counter() - started
+
+    conn = connect()
+    batches, batch, size = [], [], 0
+    for chunk in chunks:
+        batch.append(chunk)
+        size += len(chunk.events)
+        if size >= batch_size:
+            batches.append(batch)
+            batch, size = [], 0
+    if batch:
+        batches.append(batch)
+
+    started = time.perf_counter()
+    for batch in batches:
+        consumer.flush_batch(conn,
+                             [e for c in batch for e in c.events],
+                             [a for c in batch for a in c.anomalies])
+    flush = time.perf_counter() - started
+    timings["build params"] = flush - conn.seconds
+    timings["write"] = conn.seconds
+    conn.close()
+    return timings
+
+
+def run_pipeline(polls: list[dict], connect: Callable[[], NullConnection]) -> float:
+    """Push every poll through the threaded pipeline; seconds until fully drained."""
+    reset_state()
+    consumer.create_db_connection = lambda *args, **kwargs: connect()
+    chunks = _chunks(polls)
+    pipeline = consumer.build_pipeline()
+    consumer.start_pipeline(pipeline)
+    started = time.perf_counter()
+    # Per-batch progress lines would dominate the output
+    with contextlib.redirect_stdout(io.StringIO()):
+        for chunk in chunks:
+            consumer.offset_tracker.track(chunk.offsets)
+            pipeline.put(chunk)
+        consumer.stop_pipeline(pipeline)
+    return time.perf_counter() - started
+
+
+# Valid JSON that decode must reject: (field, value)
+MALFORMED_FIELDS = (("speed", "fast"), ("engine_temp", [1]), ("ts", 1.5), ("lat", 123.0), ("vehicle_id", 7))
+
+
+def inject_malformed(polls: list[dict], count: int) -> int:
+    """Replace ``count`` records, spread over the run, with wrongly typed ones; returns how many."""
+    slots = [(messages, tp, i) for messages in polls for tp, records in messages.items()
+             for i in range(len(records))]
+    if not count or not slots:
+        return 0
+    chosen = slots[::max(1, len(slots) // count)][:count]
+    for n, (messages, tp, i) in enumerate(chosen):
+        record = messages[tp][i]
+        value = json.loads(record.value)
+        field, bad = MALFORMED_FIELDS[n % len(MALFORMED_FIELDS)]
+        value[field] = bad
+        messages[tp][i] = record._replace(value=json.dumps(value).encode("utf-8"))
+    return len(chosen)
+
+
+def check_quarantine(polls: list[dict], connect: Callable[[], NullConnection], count: int) -> int:
+    """
+    Run the pipeline over ``polls`` with ``count`` malformed records and
+    assert they, and only they, are dead-lettered and every offset is
+    committable. Returns the number quarantined.
+    """
+    total = sum(len(records) for messages in polls for records in messages.values())
+    count = inject_malformed(polls, count)
+    expected = {}
+    for messages in polls:
+        for tp, records in messages.items():
+            expected[tp] = max(expected.get(tp, 0), records[-1].offset + 1)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # No topic: quarantined records go to a local file
+        consumer.dead_letters = DeadLetterSink(consumer.kafka_bootstrap, topic="",
+                                               path=os.path.join(directory, "dead_letter.jsonl"))
+        run_pipeline(polls, connect)
+        with open(consumer.dead_letters.path) as f:
+            quarantined = [json.loads(line) for line in f]
+
+    assert len(quarantined) == count, f"{len(quarantined)} records quarantined, expected {count}"
+    assert all(entry["kind"] == "record" for entry in quarantined)
+    written = consumer.stats.total_events + consumer.stats.total_duplicates
+    assert written == total - count, f"{written} events written, expected {total - count}"
+    committable = consumer.offset_tracker.committable()
+    assert committable == expected, "offsets behind quarantined records were not released"
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the consumer ingest path without Kafka or SingleStore")
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--vehicles", type=int, default=500)
+    parser.add_argument("--customers", type=int, default=4)
+    parser.add_argument("--partitions", type=int, default=6)
+    parser.add_argument("--poll-size", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=consumer.batch_size)
+    parser.add_argument("--sink", choices=sorted(SINKS), default="null")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--malformed", type=int, default=0,
+                        help="check that this many wrongly typed records are dead-lettered")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    print(f"Simulating {args.events:,} events from {args.vehicles:,} vehicles...")
+    polls = simulate(args.events, args.vehicles, args.customers, args.partitions, args.poll_size)
+    connect = SINKS[args.sink]
+
+    print(f"\nStages (batch size {args.batch_size}, {args.sink} sink):")
+    timings = run_stages(polls, args.batch_size, connect)
+    total = sum(timings.values())
+    for stage, seconds in timings.items():
+        print(f"  {stage:14s} {seconds:7.3f}s  {seconds / total:6.1%}  "
+              f"{seconds / args.events * 1e6:7.2f} us/event")
+    print(f"  {'total':14s} {total:7.3f}s          {args.events / total:>11,.0f} events/s")
+
+    print(f"\nPipeline (decode={consumer.decode_workers} detect={consumer.detect_workers} "
+          f"write={consumer.write_workers}):")
+    elapsed = run_pipeline(polls, connect)
+    print(f"  {args.events:,} events  {elapsed:7.3f}s  {args.events / elapsed:>11,.0f} events/s")
+
+    if args.malformed:
+        count = check_quarantine(polls, connect, args.malformed)
+        print(f"\nQuarantine OK: {count} malformed records dead-lettered, "
+              f"the other {args.events - count:,} written and committed")
+
+
+if __name__ == "__main__":
+    main()
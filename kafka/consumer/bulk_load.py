@@ -0,0 +1,183 @@
+"""
+Ford Fleet Management Demo - Bulk Load Paths for telemetry_raw
+
+``executemany`` pays protocol overhead per row, which dominates at tens of
+thousands of events per second. Two faster paths are available:
+
+- multi-row ``INSERT ... VALUES (...), (...)`` statements, each sized to a
+  byte budget so large batches become a handful of round trips
+- ``LOAD DATA LOCAL INFILE ':stream:'`` fed from an in-memory TSV buffer,
+  which skips SQL parsing per row entirely (needs ``local_infile`` on the
+  connection, so it is opt-in via TELEMETRY_LOAD_DATA)
+
+``insert_rows`` picks a path per batch size. Run this module directly to
+benchmark every path against ``executemany`` on a scratch table:
+
+    python bulk_load.py --rows 50000
+"""
+
+import argparse
+import io
+import os
+import time
+from typing import Any, Callable, Optional, Sequence
+
+from events import TELEMETRY_COLUMNS, from_dict
+
+METHOD_EXECUTEMANY = "executemany"
+METHOD_MULTIROW = "multirow"
+METHOD_LOAD_DATA = "load_data"
+METHODS = (METHOD_EXECUTEMANY, METHOD_MULTIROW, METHOD_LOAD_DATA)
+
+# Batches below this many rows are not worth building a big statement for
+MULTIROW_MIN_ROWS = int(os.getenv("TELEMETRY_MULTIROW_MIN_ROWS", "50"))
+# Upper bound on the SQL text of one multi-row INSERT (below max_allowed_packet)
+MULTIROW_MAX_BYTES = int(os.getenv("TELEMETRY_MULTIROW_MAX_BYTES", str(4 * 1024 * 1024)))
+# Batches at or above this size stream through LOAD DATA when it is enabled
+LOAD_DATA_MIN_ROWS = int(os.getenv("TELEMETRY_LOAD_DATA_MIN_ROWS", "2000"))
+LOAD_DATA_ENABLED = os.getenv("TELEMETRY_LOAD_DATA", "false").lower() in ("1", "true", "yes")
+
+_TSV_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def choose_method(row_count: int) -> str:
+    """Cheapest path for a batch of ``row_count`` rows."""
+    if LOAD_DATA_ENABLED and row_count >= LOAD_DATA_MIN_ROWS:
+        return METHOD_LOAD_DATA
+    if row_count >= MULTIROW_MIN_ROWS:
+        return METHOD_MULTIROW
+    return METHOD_EXECUTEMANY
+
+
+def insert_rows(conn, table: str, columns: Sequence[str], rows: list[tuple], method: Optional[str] = None):
+    """Insert ``rows`` (tuples in ``columns`` order) using ``method`` or the one chosen for the size."""
+    if not rows:
+        return
+    method = method or choose_method(len(rows))
+    if method == METHOD_LOAD_DATA:
+        load_data_stream(conn, table, columns, rows)
+    elif method == METHOD_MULTIROW:
+        insert_multirow(conn, table, columns, rows)
+    else:
+        insert_executemany(conn, table, columns, rows)
+
+
+def insert_executemany(conn, table: str, columns: Sequence[str], rows: list[tuple]):
+    """Baseline: one parameterised statement, executed per row by the driver."""
+    placeholders = ", ".join(["%s"] * len(columns))
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    with conn.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def _estimate_row_bytes(row: tuple) -> int:
+    # Rendered SQL is roughly the text of each value plus quotes and commas
+    return sum(len(str(v)) + 3 for v in row) + 2
+
+
+def insert_multirow(conn, table: str, columns: Sequence[str], rows: list[tuple],
+                    max_bytes: int = MULTIROW_MAX_BYTES):
+    """One ``INSERT ... VALUES (...), (...)`` per ``max_bytes`` of rendered rows."""
+    head = f"INSERT INTO {table} ({', '.join(columns)}) VALUES "
+    group = "(" + ", ".join(["%s"] * len(columns)) + ")"
+
+    with conn.cursor() as cursor:
+        start = 0
+        while start < len(rows):
+            size = len(head)
+            end = start
+            while end < len(rows):
+                row_bytes = _estimate_row_bytes(rows[end])
+                if end > start and size + row_bytes > max_bytes:
+                    break
+                size += row_bytes
+                end += 1
+            chunk = rows[start:end]
+            params = [v for row in chunk for v in row]
+            cursor.execute(head + ", ".join([group] * len(chunk)), params)
+            start = end
+
+
+def _tsv_value(value: Any) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    return str(value).translate(_TSV_ESCAPES)
+
+
+def to_tsv(rows: list[tuple]) -> bytes:
+    """Rows as LOAD DATA's default format: tab-separated, ``\\N`` for NULL."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_tsv_value(v) for v in row))
+        buffer.write("\n")
+    return buffer.getvalue().encode("utf-8")
+
+
+def load_data_stream(conn, table: str, columns: Sequence[str], rows: list[tuple]):
+    """Stream rows as TSV through ``LOAD DATA LOCAL INFILE ':stream:'``."""
+    sql = (
+        f"LOAD DATA LOCAL INFILE ':stream:' INTO TABLE {table} "
+        f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+        f"({', '.join(columns)})"
+    )
+    with conn.cursor() as cursor:
+        cursor.execute(sql, infile_stream=io.BytesIO(to_tsv(rows)))
+
+
+def _synthetic_rows(count: int) -> list[tuple]:
+    start = int(time.time() * 1_000_000)
+    rows = []
+    for i in range(count):
+        rows.append(from_dict({
+            "customer_id": "bench", "vehicle_id": f"BENCH-{i % 5000:05d}", "ts": start + i,
+            "region_id": "R1", "territory_id": "T1", "lat": 42.3 + i % 100 / 1e4,
+            "lon": -83.0 - i % 100 / 1e4, "speed": float(i % 120), "engine_temp": 195.5,
+            "fuel_pct": 63.2, "battery_v": 12.6, "odometer": 40000 + i, "dtc_code": None,
+            "heading": float(i % 360), "rpm": 2100, "throttle_pct": 22.5,
+            "access_roles": ",bench,",
+        }))
+    return rows
+
+
+def benchmark(connect: Callable[..., Any], rows: int, batch_size: int, methods: Sequence[str]):
+    """Time each method inserting ``rows`` rows in ``batch_size`` batches into a scratch table."""
+    table = "telemetry_raw_bulk_bench"
+    data = _synthetic_rows(rows)
+    conn = connect()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            cursor.execute(f"CREATE TABLE {table} LIKE telemetry_raw")
+        for method in methods:
+            with conn.cursor() as cursor:
+                cursor.execute(f"TRUNCATE TABLE {table}")
+            started = time.perf_counter()
+            for i in range(0, rows, batch_size):
+                insert_rows(conn, table, TELEMETRY_COLUMNS, data[i:i + batch_size], method=method)
+                conn.commit()
+            elapsed = time.perf_counter() - started
+            print(f"{method:12s} {rows:>9,} rows  {elapsed:7.2f}s  {rows / elapsed:>11,.0f} rows/s")
+    finally:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark telemetry_raw insert paths")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--methods", default=",".join(METHODS),
+                        help="comma-separated subset of: " + ", ".join(METHODS))
+    args = parser.parse_args()
+
+    from telemetry_consumer import create_db_connection
+
+    methods = [m.strip() for m in args.methods.split(",") if m.strip()]
+    benchmark(lambda: create_db_connection(local_infile=True), args.rows, args.batch_size, methods)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Ford Fleet Management Demo - Dead Letter Handling
+
+A record SingleStore rejects (or one that cannot be decoded) used to stall
+its whole batch in a reconnect-and-retry loop. ``isolate`` bisects a
+failing batch so every good record still lands and only the poison ones
+are left; those go to ``DeadLetterSink`` with the error that rejected
+them: a Kafka topic when one is reachable, otherwise a local JSONL file.
+A record whose topic send fails later, in the producer's background
+thread, is written to the file as well.
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Callable, Optional
+
+from kafka import KafkaProducer
+
+DEAD_LETTER_TOPIC = os.getenv("DEAD_LETTER_TOPIC", "telemetry_dead_letter")
+DEAD_LETTER_PATH = os.getenv("DEAD_LETTER_PATH", "dead_letter.jsonl")
+
+
+def isolate(
+    items: list[Any],
+    write: Callable[[list[Any]], None],
+    quarantine: Callable[[Any, Exception], None],
+    retryable: tuple[type, ...] = ()
+):
+    """
+    Write ``items``, splitting on failure until the rejected ones are alone.
+
+    ``write`` must commit or roll back each call by itself. Items from a
+    half that succeeds are not retried. ``retryable`` errors say nothing
+    about the data and are raised instead of bisected.
+    """
+    if not items:
+        return
+    try:
+        write(items)
+        return
+    except retryable:
+        raise
+    except Exception as e:
+        if len(items) == 1:
+            quarantine(items[0], e)
+            return
+    mid = len(items) // 2
+    isolate(items[:mid], write, quarantine, retryable)
+    isolate(items[mid:], write, quarantine, retryable)
+
+
+class DeadLetterSink:
+    """Routes quarantined records to the dead-letter topic or a local file."""
+
+    def __init__(
+        self,
+        bootstrap_servers: str,
+        topic: str = DEAD_LETTER_TOPIC,
+        path: str = DEAD_LETTER_PATH
+    ):
+        self.bootstrap_servers = bootstrap_servers
+        self.topic = topic
+        self.path = path
+        self._producer: Optional[KafkaProducer] = None
+        self._producer_failed = False
+        self._lock = threading.Lock()
+        # Separate from _lock: send errbacks run on the producer's I/O thread
+        self._file_lock = threading.Lock()
+        self.count = 0
+
+    def _get_producer(self) -> Optional[KafkaProducer]:
+        if self._producer is None and not self._producer_failed and self.topic:
+            try:
+                self._producer = KafkaProducer(
+                    bootstrap_servers=self.bootstrap_servers,
+                    value_serializer=lambda v: json.dumps(v, default=str).encode("utf-8")
+                )
+            except Exception as e:
+                print(f"Dead-letter topic unavailable, writing to {self.path}: {e}")
+                self._producer_failed = True
+        return self._producer
+
+    def send(self, kind: str, record: Any, reason: Exception, source: Optional[str] = None):
+        """Quarantine one record with the reason it was rejected."""
+        entry = {
+            "kind": kind,
+            "reason": f"{type(reason).__name__}: {reason}",
+            "source": source,
+            "quarantined_at": datetime.utcnow().isoformat(timespec="microseconds") + "Z",
+            "record": record,
+        }
+        with self._lock:
+            self.count += 1
+            producer = self._get_producer()
+            if producer is not None:
+                try:
+                    future = producer.send(self.topic, entry)
+                    future.add_errback(lambda e: self._fallback(entry, e))
+                    return
+                except Exception as e:
+                    print(f"Dead-letter send failed, writing to {self.path}: {e}")
+            self._write_file(entry)
+
+    def _fallback(self, entry: dict[str, Any], error: Exception):
+        print(f"Dead-letter publish failed, writing to {self.path}: {error}")
+        self._write_file(entry)
+
+    def _write_file(self, entry: dict[str, Any]):
+        with self._file_lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry, default=str) + "\n")
+
+    def close(self):
+        if self._producer is not None:
+            self._producer.flush(timeout=10)
+            self._producer.close(timeout=10)
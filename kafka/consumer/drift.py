@@ -0,0 +1,188 @@
+"""
+Ford Fleet Management Demo - Stateful Drift Detection
+
+Threshold rules only see one event at a time. Drift rules watch how a
+vehicle's readings move: an engine temperature climbing fast, a battery
+voltage steadily falling, or a reading far outside the vehicle's own
+recent range.
+
+Each vehicle gets a dense integer index on first sight, and per-field
+state lives in ``array('d')`` columns indexed by it (last timestamp,
+EWMA mean and variance, and the EWMA slope of that mean), so memory is
+under 40 bytes per vehicle per field and every event is an O(1) update with no
+``telemetry_raw`` queries.
+"""
+
+import math
+import os
+import threading
+import uuid
+from array import array
+from datetime import datetime
+from typing import Any, Optional
+
+from events import EPOCH, TelemetryEvent
+
+# EWMA time constant: older samples decay by 1/e per this many seconds
+DRIFT_TAU_SECONDS = float(os.getenv("DRIFT_TAU_SECONDS", "120"))
+# Samples a vehicle needs before its drift rules may fire
+DRIFT_MIN_SAMPLES = int(os.getenv("DRIFT_MIN_SAMPLES", "10"))
+# A gap longer than this restarts a vehicle's slope tracking
+DRIFT_MAX_GAP_SECONDS = float(os.getenv("DRIFT_MAX_GAP_SECONDS", "300"))
+
+# Slopes are per minute; z-scores compare a reading against the vehicle's EWMA,
+# with the deviation floored at min_std so a steady vehicle is not all outliers
+drift_rules = {
+    "engine_temp_rising": {"field": "engine_temp", "slope_above": 10.0, "severity": "warning"},
+    "battery_draining": {"field": "battery_v", "slope_below": -0.6, "severity": "warning"},
+    "engine_temp_outlier": {"field": "engine_temp", "zscore_above": 4.0, "min_std": 2.0, "severity": "warning"},
+}
+
+
+def event_seconds(ts: datetime) -> float:
+    """Event timestamp (naive UTC) as epoch seconds."""
+    return (ts - EPOCH).total_seconds()
+
+
+class _FieldState:
+    """Per-vehicle rolling state for one telemetry field."""
+
+    __slots__ = ("last_ts", "slope", "mean", "var", "samples")
+
+    def __init__(self):
+        self.last_ts = array("d")
+        self.slope = array("d")
+        self.mean = array("d")
+        self.var = array("d")
+        self.samples = array("L")
+
+    def grow(self, size: int):
+        missing = size - len(self.samples)
+        if missing > 0:
+            zeros = [0.0] * missing
+            self.last_ts.extend(zeros)
+            self.slope.extend(zeros)
+            self.mean.extend(zeros)
+            self.var.extend(zeros)
+            self.samples.extend([0] * missing)
+
+
+class DriftDetector:
+    """Incrementally updated drift rules over every vehicle seen."""
+
+    def __init__(
+        self,
+        rules: Optional[dict[str, dict[str, Any]]] = None,
+        tau_seconds: float = DRIFT_TAU_SECONDS,
+        min_samples: int = DRIFT_MIN_SAMPLES,
+        max_gap_seconds: float = DRIFT_MAX_GAP_SECONDS
+    ):
+        self.rules = drift_rules if rules is None else rules
+        self.tau = tau_seconds
+        self.min_samples = min_samples
+        self.max_gap = max_gap_seconds
+        self._index: dict[str, int] = {}
+        self._fields = {config["field"]: _FieldState() for config in self.rules.values()}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _vehicle(self, vehicle_id: str) -> int:
+        i = self._index.get(vehicle_id)
+        if i is None:
+            i = self._index[vehicle_id] = len(self._index)
+            for state in self._fields.values():
+                state.grow(i + 1)
+        return i
+
+    def _update(self, state: _FieldState, i: int, value: float, t: float) -> Optional[tuple[float, float]]:
+        """Fold one reading in; returns its deviation and std dev against the prior EWMA."""
+        n = state.samples[i]
+        if n == 0 or t - state.last_ts[i] > self.max_gap:
+            state.last_ts[i] = t
+            state.slope[i] = 0.0
+            state.mean[i] = value
+            state.var[i] = 0.0
+            state.samples[i] = 1
+            return None
+
+        dt = t - state.last_ts[i]
+        alpha = 1.0 - math.exp(-dt / self.tau)
+        deviation = (value - state.mean[i], math.sqrt(state.var[i]))
+
+        diff = value - state.mean[i]
+        increment = alpha * diff
+        state.mean[i] += increment
+        state.var[i] = (1.0 - alpha) * (state.var[i] + diff * increment)
+        # Slope of the smoothed level, so single noisy readings barely move it
+        per_minute = increment * 60.0 / dt
+        state.slope[i] += alpha * (per_minute - state.slope[i])
+        state.last_ts[i] = t
+        state.samples[i] = n + 1
+        return deviation
+
+    def update(self, events: list[TelemetryEvent]) -> list[dict[str, Any]]:
+        """Fold a batch of events into vehicle state and return drift anomalies."""
+        anomalies = []
+        with self._lock:
+            for event in events:
+                try:
+                    t = event_seconds(event.ts)
+                except (TypeError, ValueError):
+                    continue
+                i = self._vehicle(event.vehicle_id)
+
+                deviations: dict[str, Optional[tuple[float, float]]] = {}
+                for field, state in self._fields.items():
+                    value = getattr(event, field)
+                    # Out-of-order readings (e.g. from another detect worker) are skipped
+                    if value is None or (state.samples[i] and t <= state.last_ts[i]):
+                        continue
+                    deviations[field] = self._update(state, i, float(value), t)
+
+                for name, config in self.rules.items():
+                    field = config["field"]
+                    if field not in deviations:
+                        continue
+                    state = self._fields[field]
+                    if state.samples[i] < self.min_samples:
+                        continue
+                    anomaly = self._check(name, config, event, state.slope[i], deviations[field])
+                    if anomaly:
+                        anomalies.append(anomaly)
+        return anomalies
+
+    def _check(self, name: str, config: dict[str, Any], event: TelemetryEvent,
+               slope: float, deviation: Optional[tuple[float, float]]) -> Optional[dict[str, Any]]:
+        field = config["field"]
+        z = None
+        if deviation is not None and "zscore_above" in config:
+            delta, std = deviation
+            z = delta / max(std, config.get("min_std", 0.0) or 1e-9)
+        if "slope_above" in config and slope > config["slope_above"]:
+            value, threshold = slope, config["slope_above"]
+            description = f"{field} rising {slope:.2f}/min (limit {threshold}/min)"
+        elif "slope_below" in config and slope < config["slope_below"]:
+            value, threshold = slope, config["slope_below"]
+            description = f"{field} falling {slope:.2f}/min (limit {threshold}/min)"
+        elif z is not None and abs(z) > config["zscore_above"]:
+            value, threshold = z, config["zscore_above"]
+            description = f"{field} {getattr(event, field):.2f} is {z:+.1f} std devs from recent average"
+        else:
+            return None
+
+        return {
+            "anomaly_id": str(uuid.uuid4()),
+            "vehicle_id": event.vehicle_id,
+            "customer_id": event.customer_id,
+            "region_id": event.region_id,
+            "territory_id": event.territory_id,
+            "detected_at": event.ts,
+            "anomaly_type": name.upper(),
+            "severity": config["severity"],
+            "description": description,
+            "metric_value": value,
+            "threshold_value": threshold,
+            "access_roles": event.access_roles
+        }
@@ -0,0 +1,209 @@
+"""
+Ford Fleet Management Demo - Anomaly Episodes
+
+Threshold rules fire on every qualifying event, so a vehicle cruising at
+85 mph used to produce an anomaly row per event. The tracker folds those
+into one row per (vehicle, anomaly type) episode: the first trigger opens
+it, later triggers update its end time, occurrence count and peak value
+in place, and it closes once the reading recovers past the threshold by a
+hysteresis margin or nothing has triggered for the quiet period. An open
+episode is re-written when its peak changes, at most every update
+interval otherwise, and once more when it closes.
+
+Recovery is judged by the rule in effect for the event's customer and
+model in the same ``RuleSet`` detection used (see rules.py), so rules
+added to anomaly_rules and overrides that change a rule's field or
+direction close on recovery too. The hysteresis margin is the rule's own
+(anomaly_rules.hysteresis, or the default in detection.py), so it can be
+set per customer and model; with no margin an episode closes as soon as
+the reading is back on the safe side of the threshold.
+"""
+
+import os
+import threading
+from typing import Any, Optional
+
+from drift import event_seconds
+from events import TelemetryEvent
+from rules import RuleSet
+
+# Consecutive triggers needed before an episode opens
+EPISODE_OPEN_AFTER = int(os.getenv("ANOMALY_EPISODE_OPEN_AFTER", "1"))
+# An episode with no trigger for this long (event time) is closed
+EPISODE_CLOSE_SECONDS = float(os.getenv("ANOMALY_EPISODE_CLOSE_SECONDS", "120"))
+# Minimum event time between re-writes of an open episode whose peak is unchanged
+EPISODE_UPDATE_SECONDS = float(os.getenv("ANOMALY_EPISODE_UPDATE_SECONDS", "30"))
+
+
+class _Episode:
+    __slots__ = ("record", "below", "last_ts", "written_ts", "dirty")
+
+    def __init__(self, record: dict[str, Any], below: Optional[bool], last_ts: float):
+        self.record = record
+        self.below = below
+        self.last_ts = last_ts
+        self.written_ts = last_ts
+        self.dirty = False
+
+
+class EpisodeTracker:
+    """Open anomaly episodes per (vehicle, type), shared by the detect workers."""
+
+    def __init__(
+        self,
+        rules: RuleSet,
+        open_after: int = EPISODE_OPEN_AFTER,
+        close_seconds: float = EPISODE_CLOSE_SECONDS,
+        update_seconds: float = EPISODE_UPDATE_SECONDS
+    ):
+        self.open_after = max(1, open_after)
+        self.close_seconds = close_seconds
+        self.update_seconds = update_seconds
+        self.rules = rules
+        # (customer_id, model) -> {anomaly_type: (field, threshold, below, margin)} for value-based closing
+        self._clear_rules: dict[tuple[str, str], dict[str, tuple[str, float, bool, float]]] = {}
+        self._open: dict[tuple[str, str], _Episode] = {}
+        # Triggers seen before an episode opens: key -> (count, last_ts)
+        self._candidates: dict[tuple[str, str], tuple[int, float]] = {}
+        self._clock = 0.0
+        self._last_sweep = 0.0
+        # Rows produced by the chunk being processed, keyed by anomaly_id
+        self._changed: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._open)
+
+    def _emit(self, episode: _Episode):
+        self._changed[episode.record["anomaly_id"]] = dict(episode.record)
+        episode.written_ts = episode.last_ts
+        episode.dirty = False
+
+    def _close(self, key: tuple[str, str]):
+        episode = self._open.pop(key, None)
+        if episode is not None and episode.dirty:
+            self._emit(episode)
+
+    def _use(self, rules: RuleSet):
+        # A reloaded rule set invalidates every profile's clear rules
+        if rules is not self.rules:
+            self.rules = rules
+            self._clear_rules = {}
+
+    def _clear_rules_for(self, event: TelemetryEvent) -> dict[str, tuple[str, float, bool, float]]:
+        profile = self.rules.profile(event)
+        clear = self._clear_rules.get(profile)
+        if clear is None:
+            clear = self._clear_rules[profile] = {
+                rule.name.upper(): (rule.field, rule.threshold, rule.below, rule.hysteresis)
+                for rule in self.rules.resolve(*profile) if rule is not None
+            }
+        return clear
+
+    def _trigger(self, anomaly: dict[str, Any], t: float, clear_rules: dict[str, tuple]):
+        key = (anomaly["vehicle_id"], anomaly["anomaly_type"])
+        episode = self._open.get(key)
+        if episode is not None and t - episode.last_ts > self.close_seconds:
+            self._close(key)
+            episode = None
+
+        if episode is None:
+            count, last_ts = self._candidates.pop(key, (0, t))
+            if t - last_ts > self.close_seconds:
+                count = 0
+            count += 1
+            if count < self.open_after:
+                self._candidates[key] = (count, t)
+                return
+            record = dict(anomaly, ended_at=anomaly["detected_at"], occurrences=count)
+            clear = clear_rules.get(anomaly["anomaly_type"])
+            episode = self._open[key] = _Episode(record, clear[2] if clear else None, t)
+            self._emit(episode)
+            return
+
+        record = episode.record
+        episode.last_ts = max(episode.last_ts, t)
+        episode.dirty = True
+        record["occurrences"] += 1
+        if anomaly["detected_at"] > record["ended_at"]:
+            record["ended_at"] = anomaly["detected_at"]
+        value, peak = anomaly.get("metric_value"), record.get("metric_value")
+        if value is not None and (peak is None or self._worse(value, peak, episode.below)):
+            record["metric_value"] = value
+            record["description"] = anomaly["description"]
+            self._emit(episode)
+        elif episode.last_ts - episode.written_ts >= self.update_seconds:
+            self._emit(episode)
+
+    @staticmethod
+    def _worse(value: float, peak: float, below: Optional[bool]) -> bool:
+        # Threshold rules know their direction; drift rules (slopes, z-scores) peak by magnitude
+        if below is None:
+            return abs(value) > abs(peak)
+        return value < peak if below else value > peak
+
+    def _clear(self, event: TelemetryEvent, triggered: set[str], clear_rules: dict[str, tuple]):
+        vehicle_id = event.vehicle_id
+        for anomaly_type, (field, threshold, below, margin) in clear_rules.items():
+            if anomaly_type in triggered:
+                continue
+            key = (vehicle_id, anomaly_type)
+            episode = self._open.get(key)
+            if episode is None and key not in self._candidates:
+                continue
+            value = getattr(event, field)
+            if value is None:
+                continue
+            if (value >= threshold + margin) if below else (value <= threshold - margin):
+                self._close(key)
+                self._candidates.pop(key, None)
+
+    def _sweep(self):
+        horizon = self._clock - self.close_seconds
+        for key in [k for k, e in self._open.items() if e.last_ts < horizon]:
+            self._close(key)
+        for key in [k for k, (_, t) in self._candidates.items() if t < horizon]:
+            del self._candidates[key]
+        self._last_sweep = self._clock
+
+    def process(
+        self,
+        events: list[TelemetryEvent],
+        anomalies: list[dict[str, Any]],
+        rules: Optional[RuleSet] = None
+    ) -> list[dict[str, Any]]:
+        """
+        Fold a chunk's raw anomalies into episodes.
+
+        ``rules`` is the rule set the chunk was detected with; recovery is
+        judged against it from this chunk on.
+
+        Returns one row per episode the chunk opened, re-wrote or closed
+        (a copy of its current state, to be upserted by anomaly_id).
+        """
+        by_event: dict[tuple[str, str], list[dict[str, Any]]] = {}
+        for anomaly in anomalies:
+            by_event.setdefault((anomaly["vehicle_id"], anomaly["detected_at"]), []).append(anomaly)
+
+        with self._lock:
+            if rules is not None:
+                self._use(rules)
+            for event in events:
+                try:
+                    t = event_seconds(event.ts)
+                except (TypeError, ValueError):
+                    continue
+                if t > self._clock:
+                    self._clock = t
+                clear_rules = self._clear_rules_for(event)
+                triggered = set()
+                for anomaly in by_event.pop((event.vehicle_id, event.ts), ()):
+                    triggered.add(anomaly["anomaly_type"])
+                    self._trigger(anomaly, t, clear_rules)
+                self._clear(event, triggered, clear_rules)
+
+            if self._clock - self._last_sweep > self.close_seconds:
+                self._sweep()
+
+            changed, self._changed = self._changed, {}
+            return list(changed.values())
@@ -0,0 +1,165 @@
+"""
+Ford Fleet Management Demo - Telemetry Event Record
+
+Decoded events are ``TelemetryEvent`` named tuples whose fields are in
+telemetry_raw column order, so a list of events is already the parameter
+list for the bulk insert and later stages read fields as attributes
+instead of hashing string keys. Record values are parsed with orjson when
+it is installed (straight from bytes), falling back to the standard
+library.
+
+``ts`` is parsed once, here, into a naive UTC ``datetime``: later stages
+compare it natively and the insert paths bind it as a DATETIME(6) value.
+Producers may send it as integer epoch microseconds or as an ISO string.
+A ``ts`` more than MAX_FUTURE_SKEW_SECONDS ahead of the consumer's clock
+fails decode: one such reading would otherwise hold the rollup watermark,
+vehicle_state and drift baselines ahead of every later one.
+Numeric fields must be finite numbers (numeric strings are converted);
+anything else fails decode rather than a later stage.
+"""
+
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Any, NamedTuple, Optional
+
+try:
+    import orjson
+
+    def _loads(value: bytes) -> Any:
+        return orjson.loads(value)
+
+    FAST_JSON = True
+except ImportError:
+    import json
+
+    def _loads(value: bytes) -> Any:
+        return json.loads(value.decode("utf-8"))
+
+    FAST_JSON = False
+
+
+class TelemetryEvent(NamedTuple):
+    """One telemetry reading, in telemetry_raw column order."""
+
+    customer_id: str
+    vehicle_id: str
+    ts: datetime
+    region_id: str
+    territory_id: str
+    lat: Optional[float]
+    lon: Optional[float]
+    speed: Optional[float]
+    engine_temp: Optional[float]
+    fuel_pct: Optional[float]
+    battery_v: Optional[float]
+    odometer: Optional[int]
+    dtc_code: Optional[str]
+    heading: Optional[float]
+    rpm: Optional[int]
+    throttle_pct: Optional[float]
+    access_roles: str
+
+
+TELEMETRY_COLUMNS = TelemetryEvent._fields
+
+EPOCH = datetime(1970, 1, 1)
+
+# How far ahead of the consumer's clock an event time may be (producer clock skew)
+MAX_FUTURE_SKEW = timedelta(seconds=float(os.getenv("MAX_FUTURE_SKEW_SECONDS", "300")))
+
+
+def parse_ts(ts: Any) -> datetime:
+    """
+    Event time as a naive UTC datetime, from epoch microseconds or an ISO string.
+
+    Raises ValueError for a time beyond MAX_FUTURE_SKEW from now.
+    """
+    if type(ts) is int:
+        parsed = EPOCH + timedelta(microseconds=ts)
+    elif isinstance(ts, str):
+        parsed = datetime.fromisoformat(ts.rstrip("Z"))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    else:
+        raise TypeError(f"ts must be epoch microseconds or an ISO string, got {type(ts).__name__}")
+    if parsed > datetime.utcnow() + MAX_FUTURE_SKEW:
+        raise ValueError(f"ts is in the future: {parsed.isoformat()}Z")
+    return parsed
+
+
+def _text(d: dict[str, Any], field: str) -> str:
+    value = d[field]
+    if not isinstance(value, str):
+        raise TypeError(f"{field} must be a string, got {type(value).__name__}")
+    return value
+
+
+_FINITE = sys.float_info.max
+
+
+def _number(d: dict[str, Any], field: str, lower: float = -_FINITE, upper: float = _FINITE) -> Optional[float]:
+    """A numeric field as a finite float within bounds; numeric strings are accepted."""
+    value = d.get(field)
+    if value is None:
+        return None
+    kind = type(value)
+    if kind is not float and kind is not int:
+        if kind is not str:
+            raise TypeError(f"{field} must be a number, got {kind.__name__}")
+        try:
+            value = float(value)
+        except ValueError:
+            raise ValueError(f"{field} must be a number, got {value!r}") from None
+    if not lower <= value <= upper:
+        # Also rejects NaN and infinities
+        raise ValueError(f"{field} out of range: {value!r}")
+    return value
+
+
+def _integer(d: dict[str, Any], field: str) -> Optional[int]:
+    value = _number(d, field)
+    if value is None or type(value) is int:
+        return value
+    if not value.is_integer():
+        raise ValueError(f"{field} must be a whole number, got {value!r}")
+    return int(value)
+
+
+def from_dict(d: dict[str, Any]) -> TelemetryEvent:
+    """
+    Build an event from the producer's JSON object.
+
+    Field types are checked here, so a wrongly typed record fails decode
+    (and is quarantined) instead of reaching detection or the write.
+    """
+    dtc_code = d.get("dtc_code")
+    if dtc_code is not None and not isinstance(dtc_code, str):
+        raise TypeError(f"dtc_code must be a string, got {type(dtc_code).__name__}")
+    return TelemetryEvent(
+        _text(d, "customer_id"),
+        _text(d, "vehicle_id"),
+        parse_ts(d["ts"]),
+        _text(d, "region_id"),
+        _text(d, "territory_id"),
+        _number(d, "lat", -90, 90),
+        _number(d, "lon", -180, 180),
+        _number(d, "speed"),
+        _number(d, "engine_temp"),
+        _number(d, "fuel_pct"),
+        _number(d, "battery_v"),
+        _integer(d, "odometer"),
+        dtc_code,
+        _number(d, "heading"),
+        _integer(d, "rpm"),
+        _number(d, "throttle_pct"),
+        _text(d, "access_roles")
+    )
+
+
+def decode(value: bytes) -> TelemetryEvent:
+    """Decode one Kafka record value; raises ValueError/KeyError/TypeError/OverflowError if malformed."""
+    d = _loads(value)
+    if not isinstance(d, dict):
+        raise ValueError(f"expected a JSON object, got {type(d).__name__}")
+    return from_dict(d)
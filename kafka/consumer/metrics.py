@@ -0,0 +1,220 @@
+"""
+Ford Fleet Management Demo - Consumer Metrics
+
+A small Prometheus text-format registry and HTTP endpoint. Metrics are
+updated per poll, chunk or flush (never per event), each under its own
+lock, so they stay on at full ingest rate.
+
+A single consumer serves its own registry on METRICS_PORT. In
+multi-process mode each worker ships ``registry.collect()`` to the
+supervisor with its other metrics, and the supervisor serves them all
+with a ``worker`` label added.
+"""
+
+import bisect
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+# 0 disables the endpoint
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+# name, type, help, [(suffix, labels, value)]
+Family = tuple[str, str, str, list[tuple[str, tuple[tuple[str, str], ...], float]]]
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = labels
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[tuple[str, str], ...]:
+        return tuple((name, str(labels[name])) for name in self.label_names)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        # Unlabelled series report 0 from the start rather than being absent
+        self._values: dict[tuple, float] = {} if labels else {(): 0}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [("", key, value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def replace(self, values: dict[tuple, float]):
+        """Swap in a complete set of label values (label-value tuples, in label order)."""
+        values = {tuple(zip(self.label_names, map(str, k))): v for k, v in values.items()}
+        with self._lock:
+            self._values = values
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...], labels: tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket counts..., +Inf count, sum]
+        self._values: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[i] += 1
+            counts[-1] += value
+
+    def samples(self):
+        out = []
+        with self._lock:
+            items = [(key, list(counts)) for key, counts in self._values.items()]
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                out.append(("_bucket", key + (("le", le),), cumulative))
+            out.append(("_sum", key, counts[-1]))
+            out.append(("_count", key, cumulative))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name: str, help_text: str, labels: tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, buckets: tuple[float, ...],
+                  labels: tuple[str, ...] = ()) -> Histogram:
+        return self.register(Histogram(name, help_text, buckets, labels))
+
+    def collect(self) -> list[Family]:
+        """Current samples as plain tuples (picklable for the supervisor)."""
+        return [(m.name, m.kind, m.help, m.samples()) for m in self._metrics]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def render(families_by_worker: dict[Optional[int], list[Family]]) -> str:
+    """Prometheus text exposition; a non-None worker key adds a ``worker`` label."""
+    merged: dict[str, tuple[str, str, list[str]]] = {}
+    for worker, families in families_by_worker.items():
+        extra = () if worker is None else (("worker", str(worker)),)
+        for name, kind, help_text, samples in families:
+            lines = merged.setdefault(name, (kind, help_text, []))[2]
+            for suffix, labels, value in samples:
+                labels = extra + tuple(labels)
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+                lines.append(f"{name}{suffix}{{{label_text}}} {value}" if label_text
+                             else f"{name}{suffix} {value}")
+
+    out = []
+    for name, (kind, help_text, lines) in merged.items():
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(lines)
+    return "\n".join(out) + "\n"
+
+
+def serve(port: int, body: Callable[[], str]) -> Optional[ThreadingHTTPServer]:
+    """Serve ``body()`` at /metrics on a daemon thread (port 0 disables)."""
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            payload = body().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"Metrics at http://0.0.0.0:{port}/metrics")
+    return server
+
+
+registry = Registry()
+
+events_total = registry.counter(
+    "consumer_events_total", "Telemetry events written to telemetry_raw")
+events_per_second = registry.gauge(
+    "consumer_events_per_second", "Events written per second over the last report interval")
+anomalies_total = registry.counter(
+    "consumer_anomalies_total", "Anomaly triggers detected, before episode folding", ("type",))
+quarantined_total = registry.counter(
+    "consumer_quarantined_total", "Records sent to the dead-letter sink", ("kind",))
+duplicates_total = registry.counter(
+    "consumer_duplicates_total", "Repeated (vehicle_id, ts) readings dropped before the write")
+rollup_rows_total = registry.counter(
+    "consumer_rollup_rows_total", "Rows written to telemetry_rollup_1m (finalized minutes and corrections)")
+rollup_late_events_total = registry.counter(
+    "consumer_rollup_late_events_total", "Events for already finalized minutes, written as corrections")
+rollup_watermark_delay = registry.gauge(
+    "consumer_rollup_watermark_delay_seconds", "How far the rollup watermark trails the wall clock")
+spooled_events_total = registry.counter(
+    "consumer_spooled_events_total", "Events spooled to disk while SingleStore was unreachable")
+replayed_events_total = registry.counter(
+    "consumer_replayed_events_total", "Spooled events replayed into SingleStore")
+spool_bytes = registry.gauge(
+    "consumer_spool_bytes", "Size of the on-disk spool")
+reconnects_total = registry.counter(
+    "consumer_db_reconnects_total", "SingleStore reconnects by write workers")
+topic_events_total = registry.counter(
+    "consumer_topic_events_total", "Records polled per customer topic", ("topic",))
+topic_lag = registry.gauge(
+    "consumer_topic_lag", "Lag summed over each customer topic's partitions", ("topic",))
+partition_lag = registry.gauge(
+    "consumer_partition_lag", "Highwater minus consumer position", ("topic", "partition"))
+batch_size_target = registry.gauge(
+    "consumer_batch_size_target", "Batch size chosen by the adaptive controller")
+batch_events = registry.histogram(
+    "consumer_batch_events", "Events per write batch",
+    (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000))
+flush_seconds = registry.histogram(
+    "consumer_flush_seconds", "Time per write step of a batch",
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10), ("table",))
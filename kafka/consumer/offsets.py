@@ -0,0 +1,77 @@
+"""
+Ford Fleet Management Demo - Consumer Offset Tracking
+
+Offsets are committed manually, only after the records they cover are in
+SingleStore. Write workers finish batches out of order, so the tracker
+keeps each partition's in-flight offset ranges in poll order and only
+advances the committable position past a range once every range before
+it is done. A crash therefore replays at most the uncommitted tail
+(at-least-once) and never skips records.
+
+When partitions are revoked, ``wait_for`` lets the poll thread hold the
+rebalance until their in-flight ranges are written, so the final commit
+covers them and the next owner does not re-read them.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any
+
+# Partition -> (first_offset, last_offset) covered by one poll
+OffsetRanges = dict[Any, tuple[int, int]]
+
+
+class OffsetTracker:
+    """Per-partition in-flight ranges and the next offset safe to commit."""
+
+    def __init__(self):
+        self._pending: dict[Any, deque[list]] = {}
+        self._ready: dict[Any, int] = {}
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+
+    def track(self, ranges: OffsetRanges):
+        """Register ranges just handed to the pipeline (poll thread)."""
+        with self._lock:
+            for tp, (first, last) in ranges.items():
+                self._pending.setdefault(tp, deque()).append([first, last, False])
+
+    def complete(self, ranges: OffsetRanges):
+        """Mark ranges as durably written (write workers)."""
+        with self._lock:
+            for tp, (first, _) in ranges.items():
+                pending = self._pending.get(tp)
+                if not pending:
+                    continue
+                for entry in pending:
+                    if entry[0] == first:
+                        entry[2] = True
+                        break
+                while pending and pending[0][2]:
+                    self._ready[tp] = pending.popleft()[1] + 1
+            self._done.notify_all()
+
+    def wait_for(self, partitions, timeout: float) -> bool:
+        """Block until ``partitions`` have nothing in flight; False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while any(self._pending.get(tp) for tp in partitions):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._done.wait(remaining)
+            return True
+
+    def forget(self, partitions):
+        """Drop state for partitions this consumer no longer owns."""
+        with self._lock:
+            for tp in partitions:
+                self._pending.pop(tp, None)
+                self._ready.pop(tp, None)
+
+    def committable(self) -> dict[Any, int]:
+        """Pop the partitions whose commit position advanced since last call."""
+        with self._lock:
+            ready, self._ready = self._ready, {}
+            return ready
@@ -0,0 +1,222 @@
+"""
+Ford Fleet Management Demo - Consumer Pipeline Stages
+
+Threaded stages connected by bounded queues. Each stage runs a
+configurable number of workers; a full queue blocks the stage feeding it,
+so a slow stage applies backpressure instead of letting work pile up in
+memory. Throughput is bounded by the slowest stage rather than the sum
+of all of them.
+
+An item whose handler raises is passed to ``on_error`` (which
+quarantines it) and the worker moves on. A stage without ``on_error``,
+one that keeps failing, or a batch stage whose worker state or flush
+fails, is failed for good: ``put`` then raises ``StageFailed`` instead of
+blocking on a queue nobody drains, and the owner checks ``failure()``
+to exit so the process can be restarted.
+"""
+
+import queue
+import threading
+import time
+import traceback
+from typing import Any, Callable, Optional
+
+# Sentinel telling a worker to finish
+_STOP = object()
+
+# Seconds between failure checks while a put waits on a full queue
+_PUT_POLL_SECONDS = 0.5
+
+
+class StageFailed(RuntimeError):
+    """A pipeline stage stopped on an error it could not recover from."""
+
+
+class Stage:
+    """A pool of workers applying ``handler`` to each item from the inbox."""
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], Any],
+        workers: int = 1,
+        queue_size: int = 16,
+        downstream: Optional["Stage"] = None,
+        on_error: Optional[Callable[[Any, Exception], None]] = None,
+        max_errors: int = 10
+    ):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.inbox: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.downstream = downstream
+        self.on_error = on_error
+        # Consecutive failed items after which the stage gives up
+        self.max_errors = max(1, max_errors)
+        self.error: Optional[BaseException] = None
+        self._threads: list[threading.Thread] = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"{self.name}-{i}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def failure(self) -> Optional[BaseException]:
+        """The error that failed this stage or one after it, if any."""
+        stage = self
+        while stage is not None:
+            if stage.error is not None:
+                return stage.error
+            stage = stage.downstream
+        return None
+
+    def put(self, item: Any):
+        """Queue an item, blocking while the stage is saturated; raises StageFailed once the pipeline failed."""
+        while True:
+            error = self.failure()
+            if error is not None:
+                raise StageFailed(f"pipeline failed: {error!r}") from error
+            try:
+                self.inbox.put(item, timeout=_PUT_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def _fail(self, error: BaseException):
+        traceback.print_exception(type(error), error, error.__traceback__)
+        print(f"Stage {self.name} failed: {error!r}")
+        if self.error is None:
+            self.error = error
+
+    def _run(self):
+        errors = 0
+        while True:
+            item = self.inbox.get()
+            if item is _STOP:
+                return
+            try:
+                result = self.handler(item)
+                errors = 0
+            except Exception as e:
+                errors += 1
+                if self.on_error is None or errors >= self.max_errors:
+                    self._fail(e)
+                    return
+                print(f"Stage {self.name} failed on an item, quarantining it: {e!r}")
+                try:
+                    self.on_error(item, e)
+                except Exception as handler_error:
+                    self._fail(handler_error)
+                    return
+                continue
+            if result is not None and self.downstream is not None:
+                try:
+                    self.downstream.put(result)
+                except StageFailed:
+                    return
+
+    def stop(self):
+        """Let queued items finish, then stop the workers (a failed pipeline is left to exit)."""
+        if self.failure() is not None:
+            return
+        for _ in self._threads:
+            self.inbox.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+class BatchStage(Stage):
+    """
+    Terminal stage that groups items into batches per worker.
+
+    Each worker owns the state returned by ``open_worker`` (e.g. a DB
+    connection) and calls ``flush(state, items)`` once the batch reaches
+    ``batch_size`` (as measured by ``size_of``) or the oldest item has
+    waited ``batch_timeout`` seconds.
+
+    With a ``controller`` (see batching.py) the size and timeout are read
+    from it before every batch, and each flush is reported back to it
+    with its duration and the age of its oldest item (from ``age_of``).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush: Callable[[Any, list[Any]], None],
+        open_worker: Callable[[], Any],
+        close_worker: Callable[[Any], None],
+        batch_size: int,
+        batch_timeout: float,
+        size_of: Callable[[Any], int] = lambda item: 1,
+        workers: int = 1,
+        queue_size: int = 16,
+        controller: Optional[Any] = None,
+        age_of: Callable[[Any], float] = lambda item: 0.0
+    ):
+        super().__init__(name, handler=None, workers=workers, queue_size=queue_size)
+        self.flush = flush
+        self.open_worker = open_worker
+        self.close_worker = close_worker
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.size_of = size_of
+        self.controller = controller
+        self.age_of = age_of
+
+    def _limits(self) -> tuple[int, float]:
+        if self.controller is not None:
+            return self.controller.batch_size, self.controller.batch_timeout
+        return self.batch_size, self.batch_timeout
+
+    def _flush(self, state: Any, batch: list[Any], size: int):
+        started = time.monotonic()
+        self.flush(state, batch)
+        if self.controller is not None:
+            self.controller.observe(size, time.monotonic() - started, self.age_of(batch[0]))
+
+    def _run(self):
+        try:
+            state = self.open_worker()
+        except Exception as e:
+            self._fail(e)
+            return
+        batch: list[Any] = []
+        size = 0
+        deadline = 0.0
+        batch_size, batch_timeout = self._limits()
+        try:
+            while True:
+                timeout = max(0.0, deadline - time.monotonic()) if batch else None
+                try:
+                    item = self.inbox.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP:
+                    if batch:
+                        self._flush(state, batch, size)
+                    return
+
+                if item is not None:
+                    if not batch:
+                        batch_size, batch_timeout = self._limits()
+                        deadline = time.monotonic() + batch_timeout
+                    batch.append(item)
+                    size += self.size_of(item)
+
+                if batch and (size >= batch_size or time.monotonic() >= deadline):
+                    self._flush(state, batch, size)
+                    batch = []
+                    size = 0
+        except Exception as e:
+            # The batch's offsets stay uncommitted, so a restart re-reads it
+            self._fail(e)
+        finally:
+            try:
+                self.close_worker(state)
+            except Exception as e:
+                print(f"Stage {self.name} could not close its worker state: {e!r}")
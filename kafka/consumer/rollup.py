@@ -0,0 +1,172 @@
+"""
+Ford Fleet Management Demo - Watermarked Telemetry Rollups
+
+Per-minute, per-territory aggregates for telemetry_rollup_1m, built in
+the consumer as events pass through instead of re-scanning
+telemetry_raw.
+
+Events arrive late and out of order across partitions, so a minute can
+only be written once no more events for it are expected. Each partition
+tracks the newest event time it has delivered; the watermark is the
+oldest of those, minus ROLLUP_ALLOWED_LATENESS_SECONDS. A partition that
+has delivered nothing for ROLLUP_IDLE_SECONDS is left out, so a quiet
+tenant does not hold every bucket open. A minute that ends at or before
+the watermark is finalized and written once.
+
+An event for a minute that is already finalized does not reopen it: it
+goes into a correction row (``is_correction = 1``) for that minute,
+written with the next flush. Rows are additive, so readers SUM over
+every row of a minute. Open minutes are written as they stand on
+shutdown; a crash loses them (the raw events are still in
+telemetry_raw).
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from events import TelemetryEvent
+
+ROLLUP_ENABLED = os.getenv("ROLLUP_ENABLED", "true").lower() in ("1", "true", "yes")
+ROLLUP_ALLOWED_LATENESS_SECONDS = float(os.getenv("ROLLUP_ALLOWED_LATENESS_SECONDS", "30"))
+ROLLUP_IDLE_SECONDS = float(os.getenv("ROLLUP_IDLE_SECONDS", "60"))
+
+ROLLUP_COLUMNS = (
+    "customer_id", "region_id", "territory_id", "bucket_start", "is_correction",
+    "events", "speed_sum", "speed_count", "speed_max",
+    "engine_temp_sum", "engine_temp_count", "engine_temp_max",
+    "fuel_pct_sum", "fuel_pct_count", "access_roles",
+)
+
+# Aggregate slots: events, then (sum, count, max) for speed and engine_temp, (sum, count) for fuel_pct
+_EVENTS, _SPEED, _TEMP, _FUEL = 0, 1, 4, 7
+
+
+def _new_aggregate() -> list:
+    return [0, 0.0, 0, None, 0.0, 0, None, 0.0, 0]
+
+
+def _fold(agg: list, e: TelemetryEvent):
+    agg[_EVENTS] += 1
+    if e.speed is not None:
+        agg[_SPEED] += e.speed
+        agg[_SPEED + 1] += 1
+        if agg[_SPEED + 2] is None or e.speed > agg[_SPEED + 2]:
+            agg[_SPEED + 2] = e.speed
+    if e.engine_temp is not None:
+        agg[_TEMP] += e.engine_temp
+        agg[_TEMP + 1] += 1
+        if agg[_TEMP + 2] is None or e.engine_temp > agg[_TEMP + 2]:
+            agg[_TEMP + 2] = e.engine_temp
+    if e.fuel_pct is not None:
+        agg[_FUEL] += e.fuel_pct
+        agg[_FUEL + 1] += 1
+
+
+class RollupAggregator:
+    """Open minute buckets, partition watermarks and rows ready to write."""
+
+    def __init__(
+        self,
+        allowed_lateness: float = ROLLUP_ALLOWED_LATENESS_SECONDS,
+        idle_seconds: float = ROLLUP_IDLE_SECONDS
+    ):
+        self.allowed_lateness = timedelta(seconds=allowed_lateness)
+        self.idle_seconds = idle_seconds
+        # partition -> (newest event time, monotonic time it last delivered)
+        self._partitions: dict[Any, tuple[datetime, float]] = {}
+        # (customer_id, region_id, territory_id, bucket_start) -> [aggregate, access_roles]
+        self._open: dict[tuple, list] = {}
+        self._corrections: dict[tuple, list] = {}
+        self._ready: list[tuple] = []
+        # Buckets starting before this are finalized
+        self.finalized_until: Optional[datetime] = None
+        self.watermark: Optional[datetime] = None
+        self.late_events = 0
+        self._lock = threading.Lock()
+
+    def observe(self, newest: dict[Any, datetime], now: Optional[float] = None):
+        """
+        Record the newest event time each partition delivered in a chunk.
+
+        Times ahead of the wall clock (producer clock skew) count as now,
+        so the watermark never runs ahead of real time.
+        """
+        now = time.monotonic() if now is None else now
+        wall = datetime.utcnow()
+        with self._lock:
+            for tp, ts in newest.items():
+                ts = min(ts, wall)
+                current = self._partitions.get(tp)
+                if current is None or ts > current[0]:
+                    self._partitions[tp] = (ts, now)
+                else:
+                    self._partitions[tp] = (current[0], now)
+
+    def add(self, events: list[TelemetryEvent]) -> int:
+        """Fold events into their buckets; returns how many were late (corrections)."""
+        late = 0
+        with self._lock:
+            finalized_until = self.finalized_until
+            for e in events:
+                bucket = e.ts.replace(second=0, microsecond=0)
+                key = (e.customer_id, e.region_id, e.territory_id, bucket)
+                if finalized_until is not None and bucket < finalized_until:
+                    target = self._corrections
+                    late += 1
+                else:
+                    target = self._open
+                entry = target.get(key)
+                if entry is None:
+                    entry = target[key] = [_new_aggregate(), e.access_roles]
+                _fold(entry[0], e)
+            self.late_events += late
+        return late
+
+    def forget(self, partitions):
+        """Stop waiting on partitions this consumer no longer owns."""
+        with self._lock:
+            for tp in partitions:
+                self._partitions.pop(tp, None)
+
+    def advance(self, now: Optional[float] = None) -> Optional[datetime]:
+        """Recompute the watermark and finalize every bucket that ends at or before it."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            active = [ts for ts, seen in self._partitions.values() if now - seen < self.idle_seconds]
+            if not active:
+                return self.watermark
+            watermark = min(active) - self.allowed_lateness
+            if self.watermark is not None and watermark < self.watermark:
+                watermark = self.watermark
+            self.watermark = watermark
+            # A bucket is final once it ends at or before the watermark,
+            # i.e. every bucket before the one containing it
+            horizon = watermark.replace(second=0, microsecond=0)
+            if self.finalized_until is None or horizon > self.finalized_until:
+                self.finalized_until = horizon
+            for key in [k for k in self._open if k[3] < self.finalized_until]:
+                self._ready.append(self._row(key, self._open.pop(key), 0))
+            return watermark
+
+    def _row(self, key: tuple, entry: list, is_correction: int) -> tuple:
+        agg, access_roles = entry
+        return key + (is_correction,) + tuple(agg) + (access_roles,)
+
+    def drain(self, include_open: bool = False) -> list[tuple]:
+        """Take the rows ready to write (finalized buckets and corrections)."""
+        with self._lock:
+            rows, self._ready = self._ready, []
+            rows.extend(self._row(k, v, 1) for k, v in self._corrections.items())
+            self._corrections = {}
+            if include_open:
+                rows.extend(self._row(k, v, 0) for k, v in self._open.items())
+                self._open = {}
+            return rows
+
+    def restore(self, rows: list[tuple]):
+        """Put back rows whose write failed; they go out with the next drain."""
+        with self._lock:
+            self._ready = rows + self._ready
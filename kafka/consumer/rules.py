@@ -0,0 +1,212 @@
+"""
+Ford Fleet Management Demo - Anomaly Rule Table
+
+Threshold rules come from the anomaly_rules table, layered over the
+built-in defaults in detection.py, so a threshold can change (or a rule
+be added or switched off) without a redeploy. Each row scopes a rule to a
+customer, a vehicle model, both, or neither (``*``); for an event the most
+specific row wins:
+
+    (customer, model) > (customer, *) > (*, model) > (*, *) > default
+
+A row with ``enabled = 0`` switches its rule off within that scope. A
+row's ``hysteresis`` is how far past the threshold a reading must recover
+before an open anomaly episode closes (see episodes.py).
+
+``RuleSet`` is immutable once built. It resolves a (customer, model)
+profile to one rule per name the first time the profile is seen and
+caches it; ``detect_batch`` turns the resolved thresholds into a
+per-event threshold column, so overrides cost one fancy-indexing step
+per rule rather than a branch per event. ``RuleReloader`` re-reads the
+table every ANOMALY_RULES_REFRESH_SECONDS on its own thread and swaps in
+a new ``RuleSet`` when the rules or any vehicle's model changed; the detect
+stage picks the new set up with its next chunk, so ingest never pauses.
+"""
+
+import os
+import threading
+from typing import Any, Callable, Iterable, NamedTuple, Optional
+
+from events import TelemetryEvent
+
+ANOMALY_RULES_REFRESH_SECONDS = float(os.getenv("ANOMALY_RULES_REFRESH_SECONDS", "30"))
+
+# Wildcard customer_id / model in anomaly_rules
+ANY = "*"
+
+# Event fields a threshold rule can test
+RULE_FIELDS = frozenset((
+    "lat", "lon", "speed", "engine_temp", "fuel_pct", "battery_v",
+    "odometer", "heading", "rpm", "throttle_pct",
+))
+
+# (rule_name, customer_id, model, field, direction, threshold, hysteresis, severity, enabled), as in anomaly_rules
+RuleRow = tuple[str, str, str, str, str, Any, Any, str, Any]
+
+
+class Rule(NamedTuple):
+    """One threshold rule as it applies to a profile."""
+
+    name: str
+    field: str
+    below: bool
+    threshold: float
+    severity: str
+    hysteresis: float
+
+
+def rule_rows(thresholds: dict[str, dict[str, Any]]) -> list[RuleRow]:
+    """Global rows for a thresholds dict like ``detection.anomaly_thresholds``."""
+    return [
+        (name, ANY, ANY, config["field"], "below" if config.get("below", False) else "above",
+         config["threshold"], config.get("hysteresis", 0), config["severity"], 1)
+        for name, config in thresholds.items()
+    ]
+
+
+def _number(value: Any) -> float:
+    # Keep whole thresholds integral so descriptions read "80", not "80.0"
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+class RuleSet:
+    """Threshold rules with their customer and model overrides."""
+
+    def __init__(self, rows: Iterable[RuleRow], models: Optional[dict[str, str]] = None):
+        # Later rows for the same (rule_name, customer_id, model) replace earlier ones
+        self._scoped: dict[tuple[str, str, str], Optional[Rule]] = {}
+        names: dict[str, None] = {}
+        for row in rows:
+            name, customer_id, model, field, direction, threshold, hysteresis, severity, enabled = row
+            name = name.lower()
+            direction = direction.lower()
+            if field not in RULE_FIELDS or direction not in ("above", "below") or threshold is None:
+                print(f"Skipping invalid anomaly rule {row}")
+                continue
+            names.setdefault(name)
+            self._scoped[(name, customer_id or ANY, model or ANY)] = (
+                Rule(name, field, direction == "below", _number(threshold), severity,
+                     float(hysteresis or 0)) if enabled else None
+            )
+        # Rule order, which is also the order anomalies of one event are reported in
+        self.names = tuple(names)
+        # vehicle_id -> model, for model-scoped rows
+        self.models = models or {}
+        self._profiles: dict[tuple[str, str], tuple[Optional[Rule], ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._scoped)
+
+    def profile(self, event: TelemetryEvent) -> tuple[str, str]:
+        return event.customer_id, self.models.get(event.vehicle_id, ANY)
+
+    def resolve(self, customer_id: str, model: str) -> tuple[Optional[Rule], ...]:
+        """The rule in effect for each name (None where off) for one profile."""
+        resolved = self._profiles.get((customer_id, model))
+        if resolved is None:
+            scopes = ((customer_id, model), (customer_id, ANY), (ANY, model), (ANY, ANY))
+            resolved = tuple(self._pick(name, scopes) for name in self.names)
+            self._profiles[(customer_id, model)] = resolved
+        return resolved
+
+    def _pick(self, name: str, scopes: tuple[tuple[str, str], ...]) -> Optional[Rule]:
+        for customer_id, model in scopes:
+            key = (name, customer_id, model)
+            if key in self._scoped:
+                return self._scoped[key]
+        return None
+
+    def rules_for(self, event: TelemetryEvent) -> tuple[Optional[Rule], ...]:
+        return self.resolve(*self.profile(event))
+
+
+class RuleReloader:
+    """
+    Keeps ``rules`` in step with the anomaly_rules table.
+
+    ``connect()`` opens a DB connection; it is kept between refreshes and
+    reopened after an error. While the table cannot be read the current
+    rules stay in effect (the defaults, until a first read succeeds).
+    """
+
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        defaults: list[RuleRow],
+        interval: float = ANOMALY_RULES_REFRESH_SECONDS
+    ):
+        self.connect = connect
+        self.defaults = defaults
+        self.interval = interval
+        self.rules = RuleSet(defaults)
+        self.reloads = 0
+        self._conn = None
+        self._rows: Optional[list[tuple]] = None
+        self._models: dict[str, str] = {}
+        self._vehicles_version: Optional[tuple] = None
+        self._failing = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="rule-reloader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._close()
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.refresh()
+
+    def refresh(self) -> bool:
+        """Re-read the table; returns whether a new rule set was swapped in."""
+        try:
+            if self._conn is None:
+                self._conn = self.connect()
+            with self._conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT rule_name, customer_id, model, field, direction, threshold, hysteresis, severity, enabled "
+                    "FROM anomaly_rules ORDER BY rule_name, customer_id, model"
+                )
+                rows = [tuple(row) for row in cursor.fetchall()]
+                # Model overrides need vehicle_id -> model; re-read it only when the
+                # checksum over (vehicle_id, model) says a vehicle was added, removed or changed model
+                cursor.execute(
+                    "SELECT COUNT(*), SUM(CRC32(CONCAT(vehicle_id, ':', model))) FROM vehicles"
+                )
+                vehicles_version = tuple(cursor.fetchone())
+                models = self._models
+                if vehicles_version != self._vehicles_version:
+                    cursor.execute("SELECT vehicle_id, model FROM vehicles")
+                    models = dict(cursor.fetchall())
+        except Exception as e:
+            if not self._failing:
+                print(f"Could not read anomaly_rules, keeping the current rules: {e}")
+                self._failing = True
+            self._close()
+            return False
+
+        self._failing = False
+        self._vehicles_version = vehicles_version
+        if rows == self._rows and models is self._models:
+            return False
+        self._rows, self._models = rows, models
+        # One reference swap; a chunk already in detect finishes on the old set
+        self.rules = RuleSet(self.defaults + rows, models)
+        self.reloads += 1
+        print(f"Anomaly rules loaded: {len(rows)} table rows over {len(self.defaults)} defaults, "
+              f"{len(models):,} vehicle models")
+        return True
@@ -0,0 +1,206 @@
+"""
+Ford Fleet Management Demo - Disk Spool for DB Outages
+
+While SingleStore is unreachable, write workers append their batches to a
+local spool instead of blocking, so polling, offsets and ingest
+acceptance carry on through short outages. A replayer thread drains the
+spool in large writes once the DB answers again.
+
+The spool is a directory of append-only segment files. Each segment is
+preallocated and memory-mapped; a record is ``<length:u32><crc32:u32>``
+followed by the payload, and a zero length marks the end of the written
+part. A torn record from a crash fails its CRC and ends the segment.
+Segments left over from a previous run are replayed on startup.
+"""
+
+import mmap
+import os
+import pickle
+import struct
+import threading
+import zlib
+from typing import Any, Callable, Iterator, Optional
+
+SPOOL_DIR = os.getenv("SPOOL_DIR", "spool")
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+# Events per write when draining the spool
+REPLAY_BATCH_EVENTS = int(os.getenv("SPOOL_REPLAY_BATCH_EVENTS", "20000"))
+
+_HEADER = struct.Struct("<II")
+_SUFFIX = ".seg"
+
+
+def encode_batch(events: list, anomalies: list) -> bytes:
+    return pickle.dumps((events, anomalies), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def decode_batch(payload: bytes) -> tuple[list, list]:
+    return pickle.loads(payload)
+
+
+class Spool:
+    """Append-only, memory-mapped segment files in one directory."""
+
+    def __init__(self, directory: str, segment_bytes: int = SPOOL_SEGMENT_BYTES):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._path: Optional[str] = None
+        self._pos = 0
+        self._lock = threading.Lock()
+        existing = self.sealed()
+        self._next = int(os.path.basename(existing[-1])[:-len(_SUFFIX)]) + 1 if existing else 1
+
+    def _open_segment(self, size: int):
+        self._path = os.path.join(self.directory, f"{self._next:010d}{_SUFFIX}")
+        self._next += 1
+        self._file = open(self._path, "w+b")
+        self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._pos = 0
+
+    def _seal(self):
+        if self._map is None:
+            return
+        self._map.flush()
+        self._map.close()
+        # Drop the unused preallocated tail
+        self._file.truncate(self._pos)
+        self._file.close()
+        self._file = self._map = self._path = None
+        self._pos = 0
+
+    def append(self, payload: bytes):
+        """Durably append one record."""
+        need = _HEADER.size + len(payload)
+        with self._lock:
+            # Keep room for the zero-length end marker
+            if self._map is None or self._pos + need + _HEADER.size > len(self._map):
+                self._seal()
+                self._open_segment(max(self.segment_bytes, need + _HEADER.size))
+            _HEADER.pack_into(self._map, self._pos, len(payload), zlib.crc32(payload))
+            self._map[self._pos + _HEADER.size:self._pos + need] = payload
+            self._map.flush()
+            self._pos += need
+
+    def seal(self):
+        """Close the segment being written so it can be replayed."""
+        with self._lock:
+            if self._pos:
+                self._seal()
+
+    def sealed(self) -> list[str]:
+        """Segments not being written, oldest first."""
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(_SUFFIX))
+        paths = [os.path.join(self.directory, n) for n in names]
+        with self._lock:
+            return [p for p in paths if p != self._path]
+
+    def pending(self) -> bool:
+        """Whether anything is waiting to be replayed."""
+        return self._pos > 0 or bool(self.sealed())
+
+    def size_bytes(self) -> int:
+        total = 0
+        for name in os.listdir(self.directory):
+            if name.endswith(_SUFFIX):
+                try:
+                    total += os.path.getsize(os.path.join(self.directory, name))
+                except OSError:
+                    # Replayed and removed since the listing
+                    pass
+        return total
+
+    @staticmethod
+    def read(path: str) -> Iterator[bytes]:
+        """Records of one segment, stopping at the end marker or a torn record."""
+        with open(path, "rb") as f:
+            data = f.read()
+        pos = 0
+        while pos + _HEADER.size <= len(data):
+            length, crc = _HEADER.unpack_from(data, pos)
+            start = pos + _HEADER.size
+            if length == 0 or start + length > len(data):
+                return
+            payload = data[start:start + length]
+            if zlib.crc32(payload) != crc:
+                print(f"Spool segment {path} has a torn record at byte {pos}; skipping the rest")
+                return
+            yield payload
+            pos = start + length
+
+    @staticmethod
+    def remove(path: str):
+        os.remove(path)
+
+    def close(self):
+        with self._lock:
+            self._seal()
+
+
+class SpoolReplayer:
+    """
+    Drains sealed spool segments once the DB is reachable again.
+
+    ``ready()`` says whether the DB can take writes (reconnecting if
+    needed) and ``write(events, anomalies)`` writes one bulk batch.
+    """
+
+    def __init__(
+        self,
+        spool: Spool,
+        ready: Callable[[], bool],
+        write: Callable[[list, list], Any],
+        interval: float = 2.0,
+        batch_events: int = REPLAY_BATCH_EVENTS
+    ):
+        self.spool = spool
+        self.ready = ready
+        self.write = write
+        self.interval = interval
+        self.batch_events = batch_events
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="spool-replayer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                if self.spool.pending() and self.ready():
+                    self.spool.seal()
+                    for path in self.spool.sealed():
+                        self.replay(path)
+                        if self._stop.is_set():
+                            return
+            except Exception as e:
+                # Keep the segment; the next pass retries it
+                print(f"Spool replay interrupted: {e}")
+
+    def replay(self, path: str):
+        """Write one segment in large batches, then delete it."""
+        events: list = []
+        anomalies: list = []
+        replayed = 0
+        for payload in self.spool.read(path):
+            batch_events, batch_anomalies = decode_batch(payload)
+            events.extend(batch_events)
+            anomalies.extend(batch_anomalies)
+            if len(events) >= self.batch_events:
+                self.write(events, anomalies)
+                replayed += len(events)
+                events, anomalies = [], []
+        if events or anomalies:
+            self.write(events, anomalies)
+            replayed += len(events)
+        self.spool.remove(path)
+        print(f"Replayed {replayed:,} spooled events from {os.path.basename(path)}")
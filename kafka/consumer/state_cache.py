@@ -0,0 +1,89 @@
+"""
+Ford Fleet Management Demo - Vehicle State Write Cache
+
+vehicle_state is the hottest rowstore table: every batch used to rewrite
+every vehicle in it. The cache remembers what was last written for each
+vehicle so a batch only upserts vehicles whose state actually moved (or
+whose row is older than the heartbeat, keeping last_seen_ts fresh for
+"active in the last minute" queries), and never sends an event older than
+the state already written.
+"""
+
+import os
+import threading
+import time
+from typing import Any, Optional
+
+from events import TelemetryEvent
+
+# Rewrite an unchanged vehicle at least this often so last_seen_ts stays current
+HEARTBEAT_SECONDS = float(os.getenv("VEHICLE_STATE_HEARTBEAT", "15"))
+
+# Smallest change per field that is worth a write
+TOLERANCES = {
+    "lat": 0.00001,      # ~1 m
+    "lon": 0.00001,
+    "speed": 0.5,
+    "heading": 1.0,
+    "fuel_pct": 0.1,
+    "engine_temp": 0.5,
+    "battery_v": 0.05,
+    "odometer": 1,
+}
+TRACKED_FIELDS = tuple(TOLERANCES)
+
+
+def _moved(previous: tuple, current: tuple) -> bool:
+    for field, old, new in zip(TRACKED_FIELDS, previous, current):
+        if old is None or new is None:
+            if old is not new:
+                return True
+        elif abs(new - old) >= TOLERANCES[field]:
+            return True
+    return False
+
+
+class VehicleStateCache:
+    """Last vehicle_state written per vehicle, shared by the write workers."""
+
+    def __init__(self, heartbeat_seconds: float = HEARTBEAT_SECONDS):
+        self.heartbeat = heartbeat_seconds
+        # vehicle_id -> (ts, tracked field values, monotonic time written)
+        self._written: dict[str, tuple[Any, tuple, float]] = {}
+        self._lock = threading.Lock()
+        self.skipped = 0
+
+    def pending(self, events: list[TelemetryEvent], now: Optional[float] = None) -> list[TelemetryEvent]:
+        """Latest event per vehicle in ``events`` that still needs writing."""
+        latest: dict[str, TelemetryEvent] = {}
+        for e in events:
+            current = latest.get(e.vehicle_id)
+            if current is None or e.ts > current.ts:
+                latest[e.vehicle_id] = e
+
+        now = time.monotonic() if now is None else now
+        changed = []
+        with self._lock:
+            for vid, e in latest.items():
+                written = self._written.get(vid)
+                if written is not None:
+                    ts, values, written_at = written
+                    if e.ts <= ts:
+                        continue
+                    if (now - written_at < self.heartbeat
+                            and not _moved(values, tuple(getattr(e, f) for f in TRACKED_FIELDS))):
+                        continue
+                changed.append(e)
+            self.skipped += len(latest) - len(changed)
+        return changed
+
+    def remember(self, events: list[TelemetryEvent], now: Optional[float] = None):
+        """Record rows once their transaction has committed."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for e in events:
+                written = self._written.get(e.vehicle_id)
+                if written is None or e.ts > written[0]:
+                    self._written[e.vehicle_id] = (
+                        e.ts, tuple(getattr(e, f) for f in TRACKED_FIELDS), now
+                    )
@@ -0,0 +1,151 @@
+"""
+Ford Fleet Management Demo - Consumer Supervisor
+
+Runs several consumer worker processes on one host so ingest is not
+bound to a single GIL. Every worker joins the same consumer group, so
+Kafka gives each one its own subset of partitions; each worker has its
+own DB connections and batch state. The supervisor restarts workers that
+exit and aggregates the metrics they report.
+
+On SIGINT or SIGTERM the supervisor stops restarting workers, passes
+SIGTERM on to them (a container stop only signals the supervisor) and
+waits for them to drain.
+"""
+
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from typing import Any, Callable
+
+from metrics import render, serve
+
+
+class Supervisor:
+    """Starts, watches and restarts consumer worker processes."""
+
+    def __init__(
+        self,
+        target: Callable[[int, Any], None],
+        processes: int,
+        report_interval: float = 10.0,
+        restart_delay: float = 2.0,
+        metrics_port: int = 0,
+        drain_timeout: float = 30.0
+    ):
+        self.target = target
+        self.processes = processes
+        self.report_interval = report_interval
+        self.restart_delay = restart_delay
+        self.metrics_port = metrics_port
+        self.drain_timeout = drain_timeout
+        self.metrics_queue: multiprocessing.Queue = multiprocessing.Queue()
+        self.workers: dict[int, multiprocessing.Process] = {}
+        self.restarts = 0
+        # Latest snapshot per live worker, plus totals carried over from
+        # previous incarnations of restarted workers
+        self.latest: dict[int, dict[str, Any]] = {}
+        self.carried: dict[str, float] = {}
+
+    def _spawn(self, worker_id: int):
+        process = multiprocessing.Process(
+            target=self.target,
+            args=(worker_id, self.metrics_queue),
+            name=f"consumer-worker-{worker_id}",
+            daemon=False
+        )
+        process.start()
+        self.workers[worker_id] = process
+        print(f"Started worker {worker_id} (pid {process.pid})")
+
+    def _drain_metrics(self, timeout: float):
+        try:
+            snapshot = self.metrics_queue.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            self.latest[snapshot["worker_id"]] = snapshot
+            try:
+                snapshot = self.metrics_queue.get_nowait()
+            except queue.Empty:
+                return
+
+    def _check_workers(self):
+        for worker_id, process in list(self.workers.items()):
+            if process.is_alive():
+                continue
+            print(f"Worker {worker_id} (pid {process.pid}) exited with code {process.exitcode}; restarting")
+            last = self.latest.pop(worker_id, None)
+            if last:
+                for key, value in last["counters"].items():
+                    self.carried[key] = self.carried.get(key, 0) + value
+            self.restarts += 1
+            time.sleep(self.restart_delay)
+            self._spawn(worker_id)
+
+    def totals(self) -> dict[str, float]:
+        """Counters summed across live and previous workers."""
+        totals = dict(self.carried)
+        for snapshot in self.latest.values():
+            for key, value in snapshot["counters"].items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def _report(self, previous: dict[str, float], elapsed: float) -> dict[str, float]:
+        totals = self.totals()
+        events = totals.get("events", 0)
+        rate = (events - previous.get("events", 0)) / elapsed if elapsed else 0
+        alive = sum(1 for p in self.workers.values() if p.is_alive())
+        sizes = [s["gauges"]["batch_size"] for s in self.latest.values() if s.get("gauges")]
+        batch = f" | Batch size: {min(sizes)}-{max(sizes)}" if sizes else ""
+        print(f"Supervisor: {alive}/{self.processes} workers | "
+              f"Events: {int(events):,} ({rate:,.0f}/s) | "
+              f"Anomalies: {int(totals.get('anomalies', 0)):,} | "
+              f"Quarantined: {int(totals.get('quarantined', 0)):,} | "
+              f"Duplicates: {int(totals.get('duplicates', 0)):,} | "
+              f"Restarts: {self.restarts}{batch}")
+        return totals
+
+    def metrics_text(self) -> str:
+        """Prometheus exposition of every live worker's latest metrics."""
+        latest = dict(self.latest)
+        return render({worker_id: s.get("families", []) for worker_id, s in latest.items()})
+
+    def run(self):
+        """Run until interrupted, then wait for workers to drain."""
+        serve(self.metrics_port, self.metrics_text)
+        for worker_id in range(self.processes):
+            self._spawn(worker_id)
+
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+
+        last_report = time.monotonic()
+        previous: dict[str, float] = {}
+        try:
+            while not stopping.is_set():
+                self._drain_metrics(timeout=1.0)
+                self._check_workers()
+                now = time.monotonic()
+                if now - last_report >= self.report_interval:
+                    previous = self._report(previous, now - last_report)
+                    last_report = now
+        except KeyboardInterrupt:
+            pass
+
+        # On Ctrl-C workers got the same SIGINT; SIGTERM is harmless on top of it
+        print("\nSupervisor: waiting for workers to drain...")
+        for process in self.workers.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.workers.values():
+            process.join(timeout=self.drain_timeout)
+            if process.is_alive():
+                process.kill()
+        self._drain_metrics(timeout=0.1)
+        totals = self.totals()
+        print(f"Total events processed: {int(totals.get('events', 0)):,}")
+        print(f"Total anomalies detected: {int(totals.get('anomalies', 0)):,}")
+        print(f"Total records quarantined: {int(totals.get('quarantined', 0)):,}")
+        print(f"Total duplicates dropped: {int(totals.get('duplicates', 0)):,}")
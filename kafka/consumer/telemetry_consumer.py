@@ -1,23 +1,57 @@
 """
 Ford Fleet Management Demo - Kafka Telemetry Consumer
 
-Consumes telematics events from customer topics and:
+Consumes telematics events from every customer topic matching
+TOPIC_PATTERN (new customers' topics are picked up without a restart) and:
 1. Batch inserts into telemetry_raw table
 2. Updates vehicle_state with latest position/status
-3. Runs anomaly detection and inserts detected anomalies
+3. Runs anomaly detection (see detection.py) and inserts detected anomalies;
+   thresholds are re-read from the anomaly_rules table as they change
+   (see rules.py)
+
+Work flows through threaded stages (see pipeline.py):
+poll -> decode -> detect -> write, so DB writes overlap with polling
+and decoding instead of stopping them. With CONSUMER_PROCESSES > 1 a
+supervisor (see supervisor.py) runs that loop in several processes that
+share the partitions between them.
+
+Each write batch lands in one transaction, and Kafka offsets are
+committed manually only once the batch holding them is in the DB (see
+offsets.py), so a crash replays uncommitted records instead of losing
+them. While SingleStore is down, batches go to a disk spool instead
+(see spool.py) and are replayed once it is back.
 """
 
-import json
 import os
+import signal
 import socket
+import sys
+import threading
 import time
-import uuid
+from collections import Counter
 from datetime import datetime
-from typing import Any
+from typing import Any, Optional
 
 import singlestoredb as s2
-from kafka import KafkaConsumer
-from kafka.errors import NoBrokersAvailable
+from kafka import ConsumerRebalanceListener, KafkaConsumer, OffsetAndMetadata
+from kafka.errors import CommitFailedError, NoBrokersAvailable
+
+from batching import ADAPTIVE_BATCHING, AdaptiveBatcher
+from bulk_load import LOAD_DATA_ENABLED, insert_rows
+from deadletter import DeadLetterSink, isolate
+from dedup import DEDUP_ENABLED, DEDUP_WARM_ROWS, Deduplicator
+from detection import default_rule_rows, default_rules, detect_batch
+from drift import DriftDetector
+from episodes import EpisodeTracker
+from events import TELEMETRY_COLUMNS, TelemetryEvent, decode
+import metrics
+from offsets import OffsetRanges, OffsetTracker
+from pipeline import BatchStage, Stage, StageFailed
+from rollup import ROLLUP_COLUMNS, ROLLUP_ENABLED, RollupAggregator
+from rules import RuleReloader
+from spool import SPOOL_DIR, Spool, SpoolReplayer, encode_batch
+from state_cache import VehicleStateCache
+from supervisor import Supervisor
 
 # Configuration from environment
 kafka_bootstrap = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
@@ -47,20 +81,34 @@ def resolve_hostname(hostname: str) -> str:
 batch_size = int(os.getenv("BATCH_SIZE", "100"))
 batch_timeout = float(os.getenv("BATCH_TIMEOUT", "1.0"))
 
-# Topics to consume
-topics = [
-    "customer_a_telemetry",
-    "customer_b_telemetry"
-]
+# Pipeline sizing: workers per stage and bounded queue depth (in polls)
+decode_workers = int(os.getenv("DECODE_WORKERS", "1"))
+detect_workers = int(os.getenv("DETECT_WORKERS", "1"))
+write_workers = int(os.getenv("WRITE_WORKERS", "2"))
+pipeline_queue_size = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
 
-# Anomaly detection thresholds
-anomaly_thresholds = {
-    "high_engine_temp": {"field": "engine_temp", "threshold": 220, "severity": "critical"},
-    "low_battery": {"field": "battery_v", "threshold": 11.5, "severity": "warning", "below": True},
-    "speeding": {"field": "speed", "threshold": 80, "severity": "info"},
-    "low_fuel": {"field": "fuel_pct", "threshold": 10, "severity": "warning", "below": True},
-}
+# Multi-process mode: worker processes in the consumer group (1 = single process)
+consumer_processes = int(os.getenv("CONSUMER_PROCESSES", "1"))
+metrics_report_interval = float(os.getenv("METRICS_REPORT_INTERVAL", "5.0"))
 
+# Seconds between reconnect attempts while SingleStore is down (writes spool meanwhile)
+RECONNECT_INTERVAL = float(os.getenv("DB_RECONNECT_INTERVAL", "2.0"))
+# Retries of a batch that hit a transient DB error before it is treated as an outage
+TRANSIENT_RETRIES = int(os.getenv("DB_TRANSIENT_RETRIES", "3"))
+
+# Error codes that say nothing about the rows: lock wait timeout, deadlock,
+# can't connect, server gone, lost connection, connection killed, and
+# SingleStore's leaf unreachable / partition without a master (failover)
+TRANSIENT_DB_ERRORS = frozenset((1205, 1213, 2003, 2006, 2013, 1927, 1735, 1777))
+
+# Customer topics to consume, by pattern so new tenants need no redeploy
+topic_pattern = os.getenv("TOPIC_PATTERN", r"^.+_telemetry$")
+# How often topic metadata is refreshed, i.e. how soon a new topic is picked up
+topic_refresh_ms = int(os.getenv("TOPIC_METADATA_REFRESH_MS", "30000"))
+# Where a newly assigned partition without committed offsets starts
+auto_offset_reset = os.getenv("AUTO_OFFSET_RESET", "latest")
+# How long a rebalance waits for revoked partitions' in-flight records to be written
+rebalance_drain_timeout = float(os.getenv("REBALANCE_DRAIN_TIMEOUT", "20"))
 
 def create_consumer() -> KafkaConsumer:
     """Create Kafka consumer with retry logic."""
@@ -70,18 +118,20 @@ def create_consumer() -> KafkaConsumer:
     for attempt in range(max_retries):
         try:
             consumer = KafkaConsumer(
-                *topics,
                 bootstrap_servers=kafka_bootstrap,
                 group_id="fleet-telemetry-consumer",
-                value_deserializer=lambda v: json.loads(v.decode('utf-8')),
-                auto_offset_reset='latest',
-                enable_auto_commit=True,
-                auto_commit_interval_ms=5000,
+                # Values stay raw bytes; the decode stage parses them off the poll thread
+                auto_offset_reset=auto_offset_reset,
+                # Offsets are committed after each batch reaches the DB
+                enable_auto_commit=False,
                 max_poll_records=500,
-                session_timeout_ms=30000
+                session_timeout_ms=30000,
+                metadata_max_age_ms=topic_refresh_ms
             )
+            # One poll spans all matching topics, so small tenants share write batches
+            consumer.subscribe(pattern=topic_pattern, listener=DrainOnRevoke(consumer))
             print(f"Connected to Kafka at {kafka_bootstrap}")
-            print(f"Subscribed to topics: {topics}")
+            print(f"Subscribed to topics matching: {topic_pattern}")
             return consumer
         except NoBrokersAvailable:
             print(f"Waiting for Kafka... attempt {attempt + 1}/{max_retries}")
@@ -90,9 +140,8 @@ def create_consumer() -> KafkaConsumer:
     raise RuntimeError(f"Could not connect to Kafka at {kafka_bootstrap}")
 
 
-def create_db_connection():
+def create_db_connection(local_infile: bool = LOAD_DATA_ENABLED, max_retries: int = 30):
     """Create SingleStore database connection with retry logic."""
-    max_retries = 30
     retry_delay = 2
     resolved_host = resolve_hostname(db_host)
 
@@ -103,168 +152,142 @@ def create_db_connection():
                 port=db_port,
                 user=db_user,
                 password=db_password,
-                database=db_name
+                database=db_name,
+                local_infile=local_infile
             )
             print(f"Connected to SingleStore at {db_host} ({resolved_host}):{db_port}")
             return conn
         except Exception as e:
             print(f"Waiting for SingleStore... attempt {attempt + 1}/{max_retries}: {e}")
-            time.sleep(retry_delay)
+            if attempt + 1 < max_retries:
+                time.sleep(retry_delay)
 
     raise RuntimeError(f"Could not connect to SingleStore at {db_host}:{db_port}")
 
 
-def detect_anomalies(event: dict[str, Any]) -> list[dict[str, Any]]:
-    """Detect anomalies in a telemetry event."""
-    anomalies = []
-    
-    for anomaly_type, config in anomaly_thresholds.items():
-        field = config["field"]
-        threshold = config["threshold"]
-        severity = config["severity"]
-        is_below = config.get("below", False)
-        
-        value = event.get(field)
-        if value is None:
-            continue
-        
-        triggered = value < threshold if is_below else value > threshold
-        
-        if triggered:
-            anomaly = {
-                "anomaly_id": str(uuid.uuid4()),
-                "vehicle_id": event["vehicle_id"],
-                "customer_id": event["customer_id"],
-                "region_id": event["region_id"],
-                "territory_id": event["territory_id"],
-                "detected_at": event["ts"],
-                "anomaly_type": anomaly_type.upper(),
-                "severity": severity,
-                "description": f"{field} {'below' if is_below else 'above'} threshold: {value:.2f} vs {threshold}",
-                "metric_value": value,
-                "threshold_value": threshold,
-                "access_roles": event["access_roles"]
-            }
-            anomalies.append(anomaly)
-    
-    # Check for DTC codes
-    if event.get("dtc_code"):
-        anomaly = {
-            "anomaly_id": str(uuid.uuid4()),
-            "vehicle_id": event["vehicle_id"],
-            "customer_id": event["customer_id"],
-            "region_id": event["region_id"],
-            "territory_id": event["territory_id"],
-            "detected_at": event["ts"],
-            "anomaly_type": "DTC_PRESENT",
-            "severity": "warning",
-            "description": f"Diagnostic trouble code detected: {event['dtc_code']}",
-            "metric_value": None,
-            "threshold_value": None,
-            "access_roles": event["access_roles"]
-        }
-        anomalies.append(anomaly)
-    
-    return anomalies
+def flush_batch(conn, events: list[TelemetryEvent], anomalies: list[dict[str, Any]]):
+    """
+    Write one batch in a single transaction.
+
+    Telemetry, vehicle state and anomalies commit together or not at all,
+    so a retried batch never duplicates half of a previous attempt.
+    """
+    states = vehicle_state_cache.pending(events)
+    try:
+        started = time.perf_counter()
+        batch_insert_telemetry(conn, events)
+        step = time.perf_counter()
+        metrics.flush_seconds.observe(step - started, table="telemetry_raw")
+        batch_update_vehicle_state(conn, states)
+        started, step = step, time.perf_counter()
+        metrics.flush_seconds.observe(step - started, table="vehicle_state")
+        batch_insert_anomalies(conn, anomalies)
+        started, step = step, time.perf_counter()
+        metrics.flush_seconds.observe(step - started, table="anomalies")
+        conn.commit()
+        metrics.flush_seconds.observe(time.perf_counter() - step, table="commit")
+        vehicle_state_cache.remember(states)
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
 
 
-def batch_insert_telemetry(conn, events: list[dict[str, Any]]):
-    """Batch insert telemetry events into telemetry_raw table."""
+def batch_insert_telemetry(conn, events: list[TelemetryEvent]):
+    """
+    Bulk insert telemetry events into telemetry_raw table (caller commits).
+
+    The insert path (executemany, multi-row VALUES or LOAD DATA stream) is
+    chosen by batch size; see bulk_load.py. Events are already rows in
+    column order.
+    """
     if not events:
         return
     
-    sql = """
-        INSERT INTO telemetry_raw 
-        (customer_id, vehicle_id, ts, region_id, territory_id, lat, lon, 
-         speed, engine_temp, fuel_pct, battery_v, odometer, dtc_code, 
-         heading, rpm, throttle_pct, access_roles)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-    """
-    
-    values = []
-    for e in events:
-        values.append((
-            e["customer_id"],
-            e["vehicle_id"],
-            e["ts"],
-            e["region_id"],
-            e["territory_id"],
-            e.get("lat"),
-            e.get("lon"),
-            e.get("speed"),
-            e.get("engine_temp"),
-            e.get("fuel_pct"),
-            e.get("battery_v"),
-            e.get("odometer"),
-            e.get("dtc_code"),
-            e.get("heading"),
-            e.get("rpm"),
-            e.get("throttle_pct"),
-            e["access_roles"]
-        ))
-    
-    with conn.cursor() as cursor:
-        cursor.executemany(sql, values)
-    conn.commit()
+    insert_rows(conn, "telemetry_raw", TELEMETRY_COLUMNS, events)
 
 
-def batch_update_vehicle_state(conn, events: list[dict[str, Any]]):
-    """Update vehicle_state with latest telemetry for each vehicle."""
-    if not events:
+def batch_update_vehicle_state(conn, states: list[TelemetryEvent]):
+    """
+    Upsert vehicle_state from the latest event per vehicle (caller commits).
+
+    ``states`` holds at most one event per vehicle, already filtered by the
+    vehicle state cache. The update is guarded by timestamp so a delayed
+    batch from another worker cannot overwrite newer state; last_seen_ts
+    is assigned last because the other guards compare against it. Rows
+    go in primary key order, so concurrent write workers lock shared
+    vehicles in the same order and cannot deadlock each other.
+    """
+    if not states:
         return
     
-    # Get latest event per vehicle
-    latest_by_vehicle = {}
-    for e in events:
-        vid = e["vehicle_id"]
-        if vid not in latest_by_vehicle or e["ts"] > latest_by_vehicle[vid]["ts"]:
-            latest_by_vehicle[vid] = e
-    
-    # Use INSERT ... ON DUPLICATE KEY UPDATE pattern
-    # Since we don't have unique keys, we'll use REPLACE or a more complex upsert
     sql = """
-        REPLACE INTO vehicle_state 
+        INSERT INTO vehicle_state 
         (vehicle_id, last_seen_ts, status, lat, lon, speed, heading, 
          fuel_pct, engine_temp, battery_v, odometer)
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            status = IF(VALUES(last_seen_ts) > last_seen_ts, VALUES(status), status),
+            lat = IF(VALUES(last_seen_ts) > last_seen_ts, VALUES(lat), lat),
+            lon = IF(VALUES(last_seen_ts) > last_seen_ts, VALUES(lon), lon),
+            speed = IF(VALUES(last_seen_ts) > last_seen_ts, VALUES(speed), speed),
+            heading = IF(VALUES(last_seen_ts) > last_seen_ts, VALUES(heading), heading),
+            fuel_pct = IF(VALUES(last_seen_ts) > last_seen_ts, VALUES(fuel_pct), fuel_pct),
+            engine_temp = IF(VALUES(last_seen_ts) > last_seen_ts, VALUES(engine_temp), engine_temp),
+            battery_v = IF(VALUES(last_seen_ts) > last_seen_ts, VALUES(battery_v), battery_v),
+            odometer = IF(VALUES(last_seen_ts) > last_seen_ts, VALUES(odometer), odometer),
+            last_seen_ts = GREATEST(last_seen_ts, VALUES(last_seen_ts))
     """
     
     values = []
-    for e in latest_by_vehicle.values():
+    for e in sorted(states, key=lambda e: e.vehicle_id):
         values.append((
-            e["vehicle_id"],
-            e["ts"],
+            e.vehicle_id,
+            e.ts,
             "active",
-            e.get("lat"),
-            e.get("lon"),
-            e.get("speed"),
-            e.get("heading"),
-            e.get("fuel_pct"),
-            e.get("engine_temp"),
-            e.get("battery_v"),
-            e.get("odometer")
+            e.lat,
+            e.lon,
+            e.speed,
+            e.heading,
+            e.fuel_pct,
+            e.engine_temp,
+            e.battery_v,
+            e.odometer
         ))
     
     with conn.cursor() as cursor:
         cursor.executemany(sql, values)
-    conn.commit()
 
 
 def batch_insert_anomalies(conn, anomalies: list[dict[str, Any]]):
-    """Batch insert detected anomalies."""
+    """
+    Upsert anomaly episodes by anomaly_id (caller commits).
+
+    Episode rows are re-sent as they grow; a row from a batch that lands
+    late (fewer occurrences) never rolls back a newer one. occurrences is
+    assigned last because the other guards compare against it. Rows go in
+    anomaly_id order, the same lock order in every write worker.
+    """
     if not anomalies:
         return
     
     sql = """
         INSERT INTO anomalies 
         (anomaly_id, vehicle_id, customer_id, region_id, territory_id,
-         detected_at, anomaly_type, severity, description, 
+         detected_at, ended_at, occurrences, anomaly_type, severity, description, 
          metric_value, threshold_value, access_roles)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            metric_value = IF(VALUES(occurrences) > occurrences, VALUES(metric_value), metric_value),
+            description = IF(VALUES(occurrences) > occurrences, VALUES(description), description),
+            ended_at = GREATEST(ended_at, VALUES(ended_at)),
+            occurrences = GREATEST(occurrences, VALUES(occurrences))
     """
     
     values = []
-    for a in anomalies:
+    for a in sorted(anomalies, key=lambda a: a["anomaly_id"]):
         values.append((
             a["anomaly_id"],
             a["vehicle_id"],
@@ -272,6 +295,8 @@ def batch_insert_anomalies(conn, anomalies: list[dict[str, Any]]):
             a["region_id"],
             a["territory_id"],
             a["detected_at"],
+            a["ended_at"],
+            a["occurrences"],
             a["anomaly_type"],
             a["severity"],
             a["description"],
@@ -282,92 +307,657 @@ def batch_insert_anomalies(conn, anomalies: list[dict[str, Any]]):
     
     with conn.cursor() as cursor:
         cursor.executemany(sql, values)
-    conn.commit()
 
 
-def main():
-    """Main consumer loop."""
-    print("=" * 60)
-    print("Ford Fleet Management - Telemetry Consumer")
-    print("=" * 60)
-    print(f"Kafka Bootstrap: {kafka_bootstrap}")
-    print(f"SingleStore: {db_host}:{db_port}/{db_name}")
-    print(f"Batch size: {batch_size}")
-    print(f"Batch timeout: {batch_timeout}s")
-    print()
-    
-    # Create connections
+class Chunk:
+    """Unit of work passed between stages: the records from one poll."""
+
+    __slots__ = ("records", "offsets", "polled_at", "events", "anomalies", "newest")
+
+    def __init__(self, records: list, offsets: OffsetRanges):
+        self.records = records
+        self.offsets = offsets
+        self.polled_at = time.monotonic()
+        self.events: list[TelemetryEvent] = []
+        self.anomalies: list[dict[str, Any]] = []
+        # (topic, partition) -> newest event time in this chunk, for rollup watermarks
+        self.newest: dict[tuple[str, int], datetime] = {}
+
+
+drift_detector = DriftDetector()
+# Threshold rules from anomaly_rules, swapped in by a background refresh
+rule_reloader = RuleReloader(lambda: create_db_connection(max_retries=1), default_rule_rows)
+episode_tracker = EpisodeTracker(default_rules)
+
+
+def decode_chunk(chunk: Chunk) -> Chunk:
+    """Decode stage: parse raw record values into TelemetryEvent records."""
+    events = []
+    newest = chunk.newest
+    for record in chunk.records:
+        try:
+            event = decode(record.value)
+            events.append(event)
+            tp = (record.topic, record.partition)
+            if tp not in newest or event.ts > newest[tp]:
+                newest[tp] = event.ts
+        except (ValueError, KeyError, TypeError, AttributeError, OverflowError) as e:
+            source = f"{record.topic}[{record.partition}]@{record.offset}"
+            print(f"Quarantining undecodable record {source}: {e}")
+            dead_letters.send("record", record.value.decode("utf-8", "replace"), e, source)
+            stats.quarantine(1)
+            metrics.quarantined_total.inc(kind="record")
+    if deduplicator is not None:
+        decoded = len(events)
+        events = deduplicator.filter(events)
+        if len(events) < decoded:
+            stats.duplicates(decoded - len(events))
+            metrics.duplicates_total.inc(decoded - len(events))
+    chunk.events = events
+    chunk.records = None
+    return chunk
+
+
+def detect_chunk(chunk: Chunk) -> Chunk:
+    """Detect stage: threshold and drift rules, folded into anomaly episodes."""
+    # One rule set per chunk, for detection and episode recovery alike
+    rules = rule_reloader.rules
+    raw = detect_batch(chunk.events, rules) + drift_detector.update(chunk.events)
+    for anomaly_type, count in Counter(a["anomaly_type"] for a in raw).items():
+        metrics.anomalies_total.inc(count, type=anomaly_type)
+    chunk.anomalies = episode_tracker.process(chunk.events, raw, rules)
+    if rollups is not None:
+        rollups.observe(chunk.newest)
+        late = rollups.add(chunk.events)
+        if late:
+            metrics.rollup_late_events_total.inc(late)
+        rollups.advance()
+    return chunk
+
+
+def quarantine_chunk(chunk: Chunk, error: Exception):
+    """
+    A decode or detect worker failed on ``chunk``: dead-letter what it holds
+    and release its offsets, so one bad chunk neither stops the stage nor
+    holds back commits for its partitions.
+    """
+    if chunk.records is not None:
+        for record in chunk.records:
+            dead_letters.send("record", record.value.decode("utf-8", "replace"), error,
+                              f"{record.topic}[{record.partition}]@{record.offset}")
+        kind, count = "record", len(chunk.records)
+    else:
+        for event in chunk.events:
+            dead_letters.send("event", event._asdict(), error)
+        kind, count = "event", len(chunk.events)
+    stats.quarantine(count)
+    metrics.quarantined_total.inc(count, kind=kind)
+    offset_tracker.complete(chunk.offsets)
+
+
+class IngestStats:
+    """Running totals shared by the writer workers."""
+
+    def __init__(self):
+        self.total_events = 0
+        self.total_anomalies = 0
+        self.total_quarantined = 0
+        self.total_duplicates = 0
+        self._lock = threading.Lock()
+
+    def record(self, events: int, anomalies: int):
+        with self._lock:
+            before = self.total_events
+            self.total_events += events
+            self.total_anomalies += anomalies
+            total_events = self.total_events
+            total_anomalies = self.total_anomalies
+
+        if total_events // 1000 > before // 1000 or anomalies:
+            print(f"Processed {total_events:,} events | "
+                  f"Anomalies: {total_anomalies:,} | "
+                  f"Batch: {events} events, {anomalies} anomalies")
+
+    def quarantine(self, count: int):
+        with self._lock:
+            self.total_quarantined += count
+
+    def duplicates(self, count: int):
+        with self._lock:
+            self.total_duplicates += count
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "events": self.total_events,
+                "anomalies": self.total_anomalies,
+                "quarantined": self.total_quarantined,
+                "duplicates": self.total_duplicates,
+            }
+
+
+stats = IngestStats()
+offset_tracker = OffsetTracker()
+vehicle_state_cache = VehicleStateCache()
+dead_letters = DeadLetterSink(kafka_bootstrap)
+batch_controller = AdaptiveBatcher(batch_size, batch_timeout) if ADAPTIVE_BATCHING else None
+deduplicator = Deduplicator() if DEDUP_ENABLED else None
+rollups = RollupAggregator() if ROLLUP_ENABLED else None
+
+
+class DatabaseUnavailable(Exception):
+    """SingleStore could not be reached; the batch was not written."""
+
+
+def db_error_code(error: Exception) -> Optional[int]:
+    """The server error code of a driver exception, if it has one."""
+    code = getattr(error, "errno", None)
+    if code is None and error.args and isinstance(error.args[0], int):
+        code = error.args[0]
+    return code
+
+
+class DBWriter:
+    """
+    Write-stage worker state: one DB connection per worker.
+
+    With a spool, a batch that cannot reach the DB is appended to it
+    (and its offsets released) instead of blocking the worker; the
+    connection is re-tried at most every RECONNECT_INTERVAL seconds. It
+    is also opened that way, on first use, so a worker started during an
+    outage spools from the outset.
+    """
+
+    def __init__(self, spool: Optional[Spool] = None, connect_retries: int = 30):
+        self.spool = spool
+        self.conn = create_db_connection(max_retries=connect_retries) if spool is None else None
+        self.last_attempt = 0.0
+        self.spooling = False
+
+    def _connection_ok(self) -> bool:
+        try:
+            with self.conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def ready(self) -> bool:
+        """Whether the DB can take writes, reconnecting if the retry interval has passed."""
+        if self.conn is not None:
+            return True
+        now = time.monotonic()
+        if now - self.last_attempt < RECONNECT_INTERVAL:
+            return False
+        self.last_attempt = now
+        try:
+            self.conn = create_db_connection(max_retries=1)
+            metrics.reconnects_total.inc()
+            return True
+        except RuntimeError:
+            return False
+
+    def _drop_connection(self):
+        try:
+            self.conn.close()
+        except:
+            pass
+        self.conn = None
+
+    def _write(self, events: list[TelemetryEvent], anomalies: list[dict[str, Any]]):
+        """
+        Write in one transaction, reconnecting once if the connection broke.
+
+        Transient errors (TRANSIENT_DB_ERRORS: deadlocks, lock waits,
+        failover) are retried up to TRANSIENT_RETRIES times. Other errors on
+        a healthy connection are the data's fault and are raised as-is;
+        DatabaseUnavailable means the batch could not be written for a
+        reason unrelated to its rows.
+        """
+        reconnects = transient = 0
+        while True:
+            if not self.ready():
+                raise DatabaseUnavailable("SingleStore is unreachable")
+            try:
+                flush_batch(self.conn, events, anomalies)
+                return
+            except Exception as e:
+                if not self._connection_ok():
+                    print(f"Error during batch processing: {e}")
+                    self._drop_connection()
+                    if reconnects:
+                        raise DatabaseUnavailable("SingleStore is unreachable") from e
+                    reconnects += 1
+                    # Reconnect straight away for the second attempt
+                    self.last_attempt = 0.0
+                    continue
+                if db_error_code(e) not in TRANSIENT_DB_ERRORS:
+                    raise
+                transient += 1
+                if transient > TRANSIENT_RETRIES:
+                    raise DatabaseUnavailable(f"Transient error persisted: {e}") from e
+                # flush_batch rolled back; back off briefly before the retry
+                time.sleep(0.1 * transient)
+
+    def write_batch(self, events: list[TelemetryEvent], anomalies: list[dict[str, Any]]) -> dict[str, int]:
+        """Write a batch, isolating and quarantining rejected records; returns rejected counts."""
+        rejected = {"event": 0, "anomaly": 0}
+
+        def quarantine(kind: str, record: Any, error: Exception):
+            rejected[kind] += 1
+            metrics.quarantined_total.inc(kind=kind)
+            dead_letters.send(kind, record._asdict() if kind == "event" else record, error)
+
+        if events or anomalies:
+            try:
+                self._write(events, anomalies)
+            except DatabaseUnavailable:
+                raise
+            except Exception as e:
+                print(f"Batch of {len(events)} events rejected ({e}); isolating bad records")
+                isolate(events, lambda part: self._write(part, []),
+                        lambda event, error: quarantine("event", event, error),
+                        retryable=(DatabaseUnavailable,))
+                isolate(anomalies, lambda part: self._write([], part),
+                        lambda anomaly, error: quarantine("anomaly", anomaly, error),
+                        retryable=(DatabaseUnavailable,))
+                print(f"Quarantined {rejected['event']} events and {rejected['anomaly']} anomalies")
+
+        stats.quarantine(rejected["event"] + rejected["anomaly"])
+        stats.record(len(events) - rejected["event"], len(anomalies) - rejected["anomaly"])
+        metrics.events_total.inc(len(events) - rejected["event"])
+        return rejected
+
+    def flush(self, chunks: list[Chunk]):
+        """Write a batch of chunks in one transaction, or spool it while the DB is down."""
+        event_batch = [e for c in chunks for e in c.events]
+        anomaly_batch = [a for c in chunks for a in c.anomalies]
+
+        while True:
+            try:
+                self.write_batch(event_batch, anomaly_batch)
+                if self.spooling:
+                    print("SingleStore is back; spooled batches will be replayed")
+                    self.spooling = False
+                break
+            except DatabaseUnavailable:
+                if self.spool is not None:
+                    if not self.spooling:
+                        print(f"SingleStore unavailable; spooling batches to {self.spool.directory}")
+                        self.spooling = True
+                    self.spool.append(encode_batch(event_batch, anomaly_batch))
+                    metrics.spooled_events_total.inc(len(event_batch))
+                    break
+                print("SingleStore unavailable; retrying batch")
+                time.sleep(RECONNECT_INTERVAL)
+
+        # Only now may the poll thread commit these offsets
+        for chunk in chunks:
+            offset_tracker.complete(chunk.offsets)
+        metrics.batch_events.observe(len(event_batch))
+        if rollups is not None and self.conn is not None:
+            self.flush_rollups()
+
+    def flush_rollups(self, include_open: bool = False):
+        """Write finalized rollup buckets and corrections; put them back if that fails."""
+        rows = rollups.drain(include_open)
+        if not rows:
+            return
+        try:
+            insert_rows(self.conn, "telemetry_rollup_1m", ROLLUP_COLUMNS, rows)
+            self.conn.commit()
+            metrics.rollup_rows_total.inc(len(rows))
+        except Exception as e:
+            try:
+                self.conn.rollback()
+            except Exception:
+                pass
+            rollups.restore(rows)
+            print(f"Rollup write failed, retrying with the next batch: {e}")
+
+    def close(self):
+        try:
+            self.conn.close()
+        except:
+            pass
+
+
+def start_replayer(spool: Spool, writer: DBWriter) -> SpoolReplayer:
+    """
+    Drain ``spool`` through ``writer``, a DB connection of its own.
+
+    A replay cut short by another outage keeps its segment, so batches
+    already written from it are written again (at-least-once, as for
+    uncommitted Kafka offsets).
+    """
+    def write(events: list, anomalies: list):
+        writer.write_batch(events, anomalies)
+        metrics.replayed_events_total.inc(len(events))
+
+    replayer = SpoolReplayer(spool, writer.ready, write, interval=RECONNECT_INTERVAL)
+    replayer.start()
+    return replayer
+
+
+# Rows per query while warming the deduplicator
+WARM_PAGE_ROWS = 50000
+
+
+def customer_of(topic: str) -> str:
+    """Customer ID from a ``<customer_id>_telemetry`` topic name."""
+    return topic[:-len("_telemetry")] if topic.endswith("_telemetry") else topic
+
+
+def warm_deduplicator(customer_ids: list[str]) -> bool:
+    """
+    Seed the deduplicator with the newest readings of ``customer_ids``, so
+    replays after a crash are dropped.
+
+    Reads at most DEDUP_WARM_ROWS rows from the last window, newest first,
+    a page at a time, so memory stays at one page whatever the ingest rate.
+    Runs in the rebalance callback, so it tries the DB once; returns
+    whether it succeeded.
+    """
+    if not customer_ids:
+        return True
+    placeholders = ", ".join(["%s"] * len(customer_ids))
+    sql = (
+        "SELECT vehicle_id, ts FROM telemetry_raw "
+        f"WHERE customer_id IN ({placeholders}) "
+        "AND ts >= UTC_TIMESTAMP(6) - INTERVAL %s SECOND AND ts < %s "
+        "ORDER BY ts DESC LIMIT %s"
+    )
+    started = time.monotonic()
+    warmed = 0
+    conn = None
+    try:
+        conn = create_db_connection(max_retries=1)
+        # Keyset paging on the sort key: each page starts below the last one's oldest ts
+        before = datetime(9999, 1, 1)
+        with conn.cursor() as cursor:
+            while warmed < DEDUP_WARM_ROWS:
+                page = min(WARM_PAGE_ROWS, DEDUP_WARM_ROWS - warmed)
+                cursor.execute(sql, (*customer_ids, int(deduplicator.window), before, page))
+                rows = cursor.fetchall()
+                deduplicator.remember(rows)
+                warmed += len(rows)
+                if len(rows) < page:
+                    break
+                before = rows[-1][1]
+        print(f"Deduplication warmed with {warmed:,} recent readings for "
+              f"{len(customer_ids)} customers in {time.monotonic() - started:.1f}s")
+        return True
+    except Exception as e:
+        print(f"Could not warm deduplication from telemetry_raw, retrying at the next assignment: {e}")
+        return False
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+def build_pipeline(spool: Optional[Spool] = None) -> Stage:
+    """Wire decode -> detect -> write and return the first stage."""
+    writer = BatchStage(
+        "write",
+        flush=DBWriter.flush,
+        open_worker=lambda: DBWriter(spool),
+        close_worker=DBWriter.close,
+        batch_size=batch_size,
+        batch_timeout=batch_timeout,
+        size_of=lambda chunk: len(chunk.events),
+        workers=write_workers,
+        queue_size=pipeline_queue_size,
+        controller=batch_controller,
+        age_of=lambda chunk: time.monotonic() - chunk.polled_at
+    )
+    detect = Stage(
+        "detect", detect_chunk,
+        workers=detect_workers, queue_size=pipeline_queue_size, downstream=writer,
+        on_error=quarantine_chunk
+    )
+    decode = Stage(
+        "decode", decode_chunk,
+        workers=decode_workers, queue_size=pipeline_queue_size, downstream=detect,
+        on_error=quarantine_chunk
+    )
+    return decode
+
+
+def start_pipeline(first: Stage):
+    """Start every stage, last stage first so consumers exist before producers."""
+    stages = []
+    stage = first
+    while stage is not None:
+        stages.append(stage)
+        stage = stage.downstream
+    for stage in reversed(stages):
+        stage.start()
+
+
+def stop_pipeline(first: Stage):
+    """Drain and stop each stage in order, flushing pending batches."""
+    stage = first
+    while stage is not None:
+        stage.stop()
+        stage = stage.downstream
+
+
+def worker_metrics(worker_id: int) -> dict[str, Any]:
+    """Counters, batching gauges and metric families, as sent to the supervisor."""
+    return {
+        "worker_id": worker_id,
+        "counters": stats.snapshot(),
+        "gauges": batch_controller.gauges() if batch_controller else {},
+        "families": metrics.registry.collect(),
+    }
+
+
+def update_gauges(consumer: KafkaConsumer, events_delta: int, elapsed: float,
+                  spool: Optional[Spool] = None):
+    """Refresh lag and rate gauges (poll thread, once per report interval)."""
+    lags = {}
+    for tp in consumer.assignment():
+        highwater = consumer.highwater(tp)
+        if highwater is None:
+            # No fetch response for this partition yet
+            continue
+        try:
+            lags[(tp.topic, tp.partition)] = max(0, highwater - consumer.position(tp))
+        except Exception:
+            continue
+    metrics.partition_lag.replace(lags)
+    topic_lags = Counter()
+    for (topic, _), lag in lags.items():
+        topic_lags[(topic,)] += lag
+    metrics.topic_lag.replace(topic_lags)
+    metrics.events_per_second.set(events_delta / elapsed if elapsed else 0)
+    if batch_controller:
+        metrics.batch_size_target.set(batch_controller.batch_size)
+    if spool is not None:
+        metrics.spool_bytes.set(spool.size_bytes())
+    if rollups is not None and rollups.watermark is not None:
+        metrics.rollup_watermark_delay.set((datetime.utcnow() - rollups.watermark).total_seconds())
+
+
+def poll_offsets(messages: dict) -> OffsetRanges:
+    """First and last offset per partition in one poll result."""
+    return {
+        tp: (records[0].offset, records[-1].offset)
+        for tp, records in messages.items() if records
+    }
+
+
+def commit_offsets(consumer: KafkaConsumer):
+    """Commit every partition whose written prefix advanced (poll thread only)."""
+    ready = offset_tracker.committable()
+    if not ready:
+        return
+    try:
+        consumer.commit({tp: OffsetAndMetadata(offset, None) for tp, offset in ready.items()})
+    except CommitFailedError as e:
+        # Partitions moved in a rebalance; their new owner re-reads from the last commit
+        print(f"Offset commit failed: {e}")
+
+
+class DrainOnRevoke(ConsumerRebalanceListener):
+    """
+    Write and commit revoked partitions' in-flight records before giving them up.
+
+    Runs on the poll thread inside ``poll()``, so no new records enter the
+    pipeline while it waits for the write stage. On assignment it warms
+    the deduplicator for customers this process has not consumed yet,
+    before their replayed records are fetched.
+    """
+
+    def __init__(self, consumer: KafkaConsumer):
+        self.consumer = consumer
+        self.warmed_customers: set[str] = set()
+
+    def on_partitions_revoked(self, revoked):
+        if not revoked:
+            return
+        started = time.monotonic()
+        drained = offset_tracker.wait_for(revoked, rebalance_drain_timeout)
+        commit_offsets(self.consumer)
+        offset_tracker.forget(revoked)
+        if rollups is not None:
+            rollups.forget(revoked)
+        status = "drained" if drained else "timed out; the new owner re-reads the rest"
+        print(f"Rebalance: {len(revoked)} partitions revoked, {status} "
+              f"in {time.monotonic() - started:.1f}s")
+
+    def on_partitions_assigned(self, assigned):
+        print(f"Rebalance: {len(assigned)} partitions assigned")
+        if deduplicator is not None:
+            customers = sorted({customer_of(tp.topic) for tp in assigned} - self.warmed_customers)
+            if warm_deduplicator(customers):
+                self.warmed_customers.update(customers)
+
+
+def run_worker(worker_id: int = 0, metrics_queue=None):
+    """
+    Consume until interrupted (SIGINT or SIGTERM), then drain and commit.
+
+    If a pipeline stage fails for good, the worker commits what was
+    written and exits with status 1, so the supervisor (or the container
+    runtime) restarts it and the rest is re-read from Kafka.
+
+    In multi-process mode ``metrics_queue`` receives a counters snapshot
+    every METRICS_REPORT_INTERVAL seconds for the supervisor to aggregate.
+    """
+    # Create connections (each write worker opens its own DB connection)
     consumer = create_consumer()
-    conn = create_db_connection()
+    rule_reloader.refresh()
+    rule_reloader.start()
+    spool = Spool(os.path.join(SPOOL_DIR, f"worker-{worker_id}")) if SPOOL_DIR else None
+    pipeline = build_pipeline(spool)
+    start_pipeline(pipeline)
+    replay_writer = DBWriter(spool) if spool is not None else None
+    replayer = start_replayer(spool, replay_writer) if spool is not None else None
+    
+    if metrics_queue is None:
+        metrics.serve(metrics.METRICS_PORT, lambda: metrics.render({None: metrics.registry.collect()}))
     
-    print("\nStarting consumption...\n")
+    print(f"\nStarting consumption (worker {worker_id})...\n")
     
-    event_batch = []
-    anomaly_batch = []
-    last_flush = time.time()
-    total_events = 0
-    total_anomalies = 0
+    last_report = time.monotonic()
+    last_events = 0
     
+    # SIGTERM (e.g. an ECS task stop) drains like Ctrl-C instead of dropping in-flight batches
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    
+    failure = None
     try:
-        while True:
-            # Poll for messages
+        while not stopping.is_set():
+            failure = pipeline.failure()
+            if failure is not None:
+                break
+            
+            # Poll for messages; decoding and writes happen in other stages
             messages = consumer.poll(timeout_ms=100)
             
-            for topic_partition, records in messages.items():
-                for record in records:
-                    event = record.value
-                    event_batch.append(event)
-                    
-                    # Detect anomalies
-                    anomalies = detect_anomalies(event)
-                    anomaly_batch.extend(anomalies)
+            records = [r for partition_records in messages.values() for r in partition_records]
+            if records:
+                offsets = poll_offsets(messages)
+                offset_tracker.track(offsets)
+                for tp, partition_records in messages.items():
+                    metrics.topic_events_total.inc(len(partition_records), topic=tp.topic)
+                # Blocks while downstream stages are saturated (backpressure)
+                pipeline.put(Chunk(records, offsets))
             
-            # Check if we should flush
-            should_flush = (
-                len(event_batch) >= batch_size or
-                (time.time() - last_flush) >= batch_timeout and event_batch
-            )
+            commit_offsets(consumer)
             
-            if should_flush:
-                try:
-                    # Batch insert telemetry
-                    batch_insert_telemetry(conn, event_batch)
-                    
-                    # Update vehicle states
-                    batch_update_vehicle_state(conn, event_batch)
-                    
-                    # Insert anomalies
-                    batch_insert_anomalies(conn, anomaly_batch)
-                    
-                    total_events += len(event_batch)
-                    total_anomalies += len(anomaly_batch)
-                    
-                    if total_events % 1000 == 0 or anomaly_batch:
-                        print(f"Processed {total_events:,} events | "
-                              f"Anomalies: {total_anomalies:,} | "
-                              f"Batch: {len(event_batch)} events, {len(anomaly_batch)} anomalies")
-                    
-                    event_batch = []
-                    anomaly_batch = []
-                    last_flush = time.time()
-                    
-                except Exception as e:
-                    print(f"Error during batch processing: {e}")
-                    # Try to reconnect
-                    try:
-                        conn.close()
-                    except:
-                        pass
-                    conn = create_db_connection()
+            now = time.monotonic()
+            if now - last_report >= metrics_report_interval:
+                update_gauges(consumer, stats.total_events - last_events, now - last_report, spool)
+                last_events = stats.total_events
+                report = worker_metrics(worker_id)
+                if metrics_queue is not None:
+                    metrics_queue.put(report)
+                elif report["gauges"]:
+                    gauges = report["gauges"]
+                    print(f"Batch size: {gauges['batch_size']} | "
+                          f"Timeout: {gauges['batch_timeout_ms']:.0f}ms | "
+                          f"Flush p95: {gauges['flush_p95_ms']:.0f}ms")
+                last_report = now
                     
+    except StageFailed as e:
+        failure = e
     except KeyboardInterrupt:
-        print("\n\nShutting down consumer...")
-        consumer.close()
-        conn.close()
-        print(f"Total events processed: {total_events:,}")
-        print(f"Total anomalies detected: {total_anomalies:,}")
+        pass
+    
+    if failure is not None:
+        print(f"\n\nPipeline failed, exiting (worker {worker_id}): {failure!r}")
+    else:
+        print(f"\n\nShutting down consumer (worker {worker_id})...")
+    # A failed pipeline cannot drain; what it had not written is re-read after the restart
+    stop_pipeline(pipeline)
+    rule_reloader.stop()
+    if replayer is not None:
+        # Whatever is still spooled is replayed on the next start
+        replayer.stop()
+        replay_writer.close()
+        spool.close()
+    if rollups is not None and failure is None:
+        # Open minutes go out as they stand; later rows for them add up
+        try:
+            writer = DBWriter(connect_retries=1)
+            writer.flush_rollups(include_open=True)
+            writer.close()
+        except RuntimeError as e:
+            print(f"Open rollup minutes not written: {e}")
+    commit_offsets(consumer)
+    consumer.close()
+    dead_letters.close()
+    if metrics_queue is not None:
+        metrics_queue.put(worker_metrics(worker_id))
+    print(f"Total events processed: {stats.total_events:,}")
+    print(f"Total anomalies detected: {stats.total_anomalies:,}")
+    print(f"Total records quarantined: {stats.total_quarantined:,}")
+    print(f"Total duplicates dropped: {stats.total_duplicates:,}")
+    if failure is not None:
+        sys.exit(1)
+
+
+def main():
+    """Main entry point: a single consumer, or a supervisor over several."""
+    print("=" * 60)
+    print("Ford Fleet Management - Telemetry Consumer")
+    print("=" * 60)
+    print(f"Kafka Bootstrap: {kafka_bootstrap}")
+    print(f"SingleStore: {db_host}:{db_port}/{db_name}")
+    print(f"Batch size: {batch_size}" + (" (adaptive)" if batch_controller else ""))
+    print(f"Batch timeout: {batch_timeout}s")
+    print(f"Workers: decode={decode_workers} detect={detect_workers} write={write_workers}")
+    print(f"Processes: {consumer_processes}")
+    print()
+    
+    if consumer_processes > 1:
+        Supervisor(run_worker, consumer_processes, metrics_port=metrics.METRICS_PORT).run()
+    else:
+        run_worker()
 
 
 if __name__ == "__main__":
     main()
-
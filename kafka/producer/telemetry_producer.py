@@ -20,19 +20,27 @@ from kafka.errors import NoBrokersAvailable
 kafka_bootstrap = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
 events_per_second = float(os.getenv("EVENTS_PER_SECOND", "10"))
 anomaly_probability = float(os.getenv("ANOMALY_PROBABILITY", "0.02"))
+# Event "ts": integer epoch microseconds ("epoch_us") or an ISO-8601 string ("iso")
+timestamp_format = os.getenv("TIMESTAMP_FORMAT", "epoch_us")
+
+# Customers to simulate; each gets its own <customer_id>_telemetry topic,
+# which the consumer picks up by pattern without a redeploy
+customer_ids = [c.strip() for c in os.getenv("CUSTOMERS", "customer_a,customer_b").split(",") if c.strip()]
+# Vehicles per territory for customers without a fleet layout below
+vehicles_per_territory = int(os.getenv("VEHICLES_PER_TERRITORY", "5"))
+
+customer_names = {
+    "customer_a": "Acme Logistics",
+    "customer_b": "BlueStar Transport",
+}
 
-# Customer configuration - each customer has their own topic
 customers = [
     {
-        "customer_id": "customer_a",
-        "topic": "customer_a_telemetry",
-        "name": "Acme Logistics"
-    },
-    {
-        "customer_id": "customer_b", 
-        "topic": "customer_b_telemetry",
-        "name": "BlueStar Transport"
+        "customer_id": customer_id,
+        "topic": f"{customer_id}_telemetry",
+        "name": customer_names.get(customer_id, customer_id)
     }
+    for customer_id in customer_ids
 ]
 
 # Vehicle configuration by region/territory
@@ -56,6 +64,22 @@ vehicle_configs = {
     ]
 }
 
+
+def default_vehicle_configs(customer_id: str) -> list[tuple]:
+    """One small fleet per territory, with vehicle ids prefixed by the customer."""
+    territories = [
+        ("w1", "WEST", "WEST_1", 47.6062, -122.3321),
+        ("w2", "WEST", "WEST_2", 33.4484, -112.0740),
+        ("e1", "EAST", "EAST_1", 40.7128, -74.0060),
+        ("e2", "EAST", "EAST_2", 28.5383, -81.3792),
+        ("c1", "CENTRAL", "CENTRAL_1", 41.8781, -87.6298),
+        ("c2", "CENTRAL", "CENTRAL_2", 39.0997, -94.5786),
+    ]
+    return [
+        (f"v_{customer_id}_{code}_", region_id, territory_id, lat, lon, vehicles_per_territory)
+        for code, region_id, territory_id, lat, lon in territories
+    ]
+
 # DTC codes for anomaly simulation
 dtc_codes = [
     "P0171",  # System too lean
@@ -69,6 +93,13 @@ dtc_codes = [
 ]
 
 
+def event_timestamp():
+    """Current UTC time in the configured TIMESTAMP_FORMAT."""
+    if timestamp_format == "iso":
+        return datetime.utcnow().isoformat(timespec='microseconds') + "Z"
+    return time.time_ns() // 1000
+
+
 class VehicleSimulator:
     """Simulates a single vehicle's telemetry data."""
     
@@ -152,7 +183,7 @@ class VehicleSimulator:
         return {
             "customer_id": self.customer_id,
             "vehicle_id": self.vehicle_id,
-            "ts": datetime.utcnow().isoformat(timespec='microseconds') + "Z",
+            "ts": event_timestamp(),
             "region_id": self.region_id,
             "territory_id": self.territory_id,
             "lat": round(self.lat, 7),
@@ -201,7 +232,7 @@ def create_vehicles() -> dict[str, list[VehicleSimulator]]:
     
     for customer in customers:
         customer_id = customer["customer_id"]
-        configs = vehicle_configs.get(customer_id, [])
+        configs = vehicle_configs.get(customer_id) or default_vehicle_configs(customer_id)
         vehicles = []
         
         for prefix, region_id, territory_id, base_lat, base_lon, count in configs:
@@ -231,6 +262,8 @@ def main():
     print(f"Kafka Bootstrap: {kafka_bootstrap}")
     print(f"Events per second: {events_per_second}")
     print(f"Anomaly probability: {anomaly_probability}")
+    print(f"Customers: {', '.join(customer_ids)}")
+    print(f"Timestamp format: {timestamp_format}")
     print()
     
     # Create producer